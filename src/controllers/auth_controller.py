@@ -1,128 +1,311 @@
+import functools
+import logging
+import secrets
+import threading
 import streamlit as st
-from handlers.auth_handler import AuthHandler
+from cachetools import TTLCache
+from google.auth.exceptions import GoogleAuthError, RefreshError
+from googleapiclient.errors import HttpError
+from oauthlib.oauth2 import OAuth2Error
+from requests.exceptions import RequestException
+from handlers.auth_handler import AuthHandler, refresh_if_expired
 from views.auth_ui import AuthView
-from controllers.main_controller import MainController
 
 # For local testing, set to True
 IS_LOCAL = False
 
+# Query parameters Google appends to the redirect URI
+OAUTH_QUERY_PARAMS = ("code", "state", "scope", "authuser", "prompt")
 
-class AuthController:
-    def __init__(self):
-        self.configure_app()
-        self.handler = AuthHandler(
-            client_config=self.get_client_config(),
-            redirect_uri=self.get_redirect_uri(),
-        )
-        self.view = AuthView()
-        self.initialize_session()
+# Browser cookie pointing at a login kept in the session store
+SESSION_COOKIE = "gdrive_asset_manager_session"
+# Kept short, the cookie is readable from scripts on the page
+SESSION_COOKIE_MAX_AGE = 8 * 60 * 60
 
-    def get_client_config(self):
-        """Get client config from secrets.toml"""
-        try:
-            return {
-                "web": {
-                    "client_id": st.secrets.google.client_id,
-                    "client_secret": st.secrets.google.client_secret,
-                    "auth_uri": st.secrets.google.auth_uri,
-                    "token_uri": st.secrets.google.token_uri,
-                    "redirect_uris": [self.get_redirect_uri()],
-                }
-            }
-        except Exception as e:
-            st.error(f"Error loading client config: {str(e)}")
-            st.stop()
+# Login state every session starts with
+DEFAULT_AUTH_STATE = (
+    ("credentials", None),
+    ("user", None),
+    ("authenticated", False),
+)
 
-    def get_redirect_uri(self):
-        """Use production URI if running on Streamlit Cloud, otherwise local"""
-        try:
-            if IS_LOCAL:
-                redirect_uri = st.secrets.google.redirect_uris[0]
-            else:
-                redirect_uri = st.secrets.google.redirect_uris[1]
-
-            return redirect_uri
-        except Exception as e:
-            st.error(f"Error getting redirect URI: {str(e)}")
-            st.stop()
-
-    def configure_app(self):
-        AuthView.configure_page(
-            wide_layout=True,
-            expanded_sidebar=True,
-            title="GDrive Asset Manager",
-        )
+# Session state dropped when a login ends
+AUTH_SESSION_KEYS = (
+    "credentials",
+    "user",
+    "authenticated",
+    "session_key",
+    "session_cookie_set",
+    "main_controller",
+    "auth_url",
+)
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1)
+def get_google_secrets():
+    """Copy the google section of secrets.toml into a plain dict once."""
+    return dict(st.secrets["google"])
+
+
+@functools.lru_cache(maxsize=1)
+def get_redirect_uri():
+    """Use production URI if running on Streamlit Cloud, otherwise local"""
+    try:
+        redirect_uris = get_google_secrets()["redirect_uris"]
+        if IS_LOCAL:
+            redirect_uri = redirect_uris[0]
+        else:
+            redirect_uri = redirect_uris[1]
+
+        return redirect_uri
+    except (KeyError, IndexError, FileNotFoundError) as e:
+        st.error(f"Error getting redirect URI: {str(e)}")
+        st.stop()
 
-    def initialize_session(self):
-        if "auth" not in st.session_state:
-            st.session_state.auth = {
-                "credentials": None,
-                "user": None,
-                "authenticated": False,
+
+@st.cache_data
+def get_client_config(redirect_uri):
+    """Get client config from secrets.toml"""
+    try:
+        google = get_google_secrets()
+        return {
+            "web": {
+                "client_id": google["client_id"],
+                "client_secret": google["client_secret"],
+                "auth_uri": google["auth_uri"],
+                "token_uri": google["token_uri"],
+                "redirect_uris": [redirect_uri],
             }
+        }
+    except (KeyError, FileNotFoundError) as e:
+        st.error(f"Error loading client config: {str(e)}")
+        st.stop()
+
+
+@st.cache_resource
+def get_auth_handler():
+    """
+    Build the OAuth handler once per process instead of on every rerun.
+    The handler holds no per-user state, so it is safe to share.
+    """
+    redirect_uri = get_redirect_uri()
+    return AuthHandler(
+        client_config=get_client_config(redirect_uri),
+        redirect_uri=redirect_uri,
+    )
+
+
+@st.cache_resource(ttl=3000, show_spinner=False)
+def get_drive_service(token, _creds):
+    """
+    Build the Drive service once per access token instead of on every
+    rerun. The credentials themselves are not hashed, the token is the key.
+    """
+    return get_auth_handler().build_drive_service(_creds)
+
+
+@st.cache_resource
+def get_session_store():
+    """
+    Logins shared by all sessions of this process, keyed by the random id
+    stored in the session cookie. Lets a page reload or a new tab skip the
+    OAuth redirect; the credentials themselves never leave the server.
+    """
+    return TTLCache(maxsize=1024, ttl=SESSION_COOKIE_MAX_AGE)
+
+
+@st.cache_resource
+def get_session_store_lock():
+    """
+    Lock guarding the session store. The TTLCache is not thread-safe and
+    every session's script thread reads and writes it.
+    """
+    return threading.Lock()
+
+
+def configure_app():
+    # The frontend resets the page config on every full run, so it has to
+    # be sent again each time
+    AuthView.configure_page(
+        wide_layout=True,
+        expanded_sidebar=True,
+        title="GDrive Asset Manager",
+    )
+
+
+def initialize_session():
+    for key, value in DEFAULT_AUTH_STATE:
+        st.session_state.setdefault(key, value)
+
+
+class AuthController:
+    def __init__(self):
+        configure_app()
+        self.handler = get_auth_handler()
+        initialize_session()
 
     def start(self):
-        query_params = st.query_params.to_dict()
+        # Already logged in, the common case on reruns
+        if st.session_state.authenticated:
+            self.start_main_app()
+            return
 
-        # Handle OAuth callback
-        if "code" in query_params:
-            self.handle_callback(query_params)
+        # Handle OAuth callback, then show the app in the same run
+        if "code" in st.query_params:
+            if self.handle_callback():
+                self.start_main_app()
             return
 
-        # Check existing auth
-        if st.session_state.auth["authenticated"]:
+        if self.restore_session():
             self.start_main_app()
-        else:
-            self.show_login()
+            return
+
+        self.show_login()
 
-    def handle_callback(self, query_params):
+    def handle_callback(self):
+        """
+        Exchange the code Google redirected back with for a login.
+
+        Returns:
+            bool: True if the user is now logged in.
+        """
         try:
-            self.handler.fetch_token(query_params["code"])
-            creds = self.handler.get_credentials()
+            creds = self.handler.fetch_token(st.query_params["code"])
             user = self.handler.get_user_info(creds)
 
-            st.session_state.auth.update(
-                {"credentials": creds, "user": user, "authenticated": True}
-            )
+            st.session_state.credentials = creds
+            st.session_state.user = user
+            st.session_state.authenticated = True
+
+            # Keep the login so other sessions of this browser can reuse it
+            session_key = secrets.token_urlsafe(32)
+            with get_session_store_lock():
+                get_session_store()[session_key] = {
+                    "credentials": creds,
+                    "user": user,
+                }
+            st.session_state.session_key = session_key
 
-            st.query_params.clear()
-            st.rerun()
+            for key in OAUTH_QUERY_PARAMS:
+                if key in st.query_params:
+                    del st.query_params[key]
+            return True
 
-        except Exception as e:
-            st.error(f"Full error details: {str(e)}")
-            if hasattr(e, "response"):
-                st.error(f"Response content: {e.response.text}")
-            self.view.show_error(f"Authentication failed: {str(e)}")
+        except (
+            OAuth2Error,
+            GoogleAuthError,
+            HttpError,
+            RequestException,
+        ) as e:
+            logger.debug("OAuth callback failed: %s", e)
+            if getattr(e, "response", None) is not None:
+                logger.debug("Response content: %s", e.response.text)
+            AuthView.show_error(f"Authentication failed: {str(e)}")
             self.reset_session()
+            return False
 
     def start_main_app(self):
-        drive_service = self.handler.build_drive_service(
-            st.session_state.auth["credentials"]
-        )
+        # Imported here so the login page doesn't load the whole app
+        from controllers.main_controller import MainController
+
+        creds = st.session_state.credentials
+        try:
+            refresh_if_expired(creds)
+        except RefreshError as e:
+            logger.debug("Token refresh failed: %s", e)
+            AuthView.show_error("Your session has expired")
+            self.reset_session()
+            return
+
+        drive_service = get_drive_service(creds.token, creds)
 
         if not drive_service:
-            self.view.show_error("Failed to initialize Drive service")
+            AuthView.show_error("Failed to initialize Drive service")
             self.reset_session()
             return
 
-        MainController(
-            drive_service,
-            st.session_state.auth["user"]["name"],
-            st.session_state.auth["user"]["email"],
-        ).start()
+        # Set the cookie once the app is shown, a rerun would drop it
+        if not st.session_state.get("session_cookie_set"):
+            AuthView.set_cookie(
+                SESSION_COOKIE,
+                st.session_state.session_key,
+                SESSION_COOKIE_MAX_AGE,
+            )
+            st.session_state.session_cookie_set = True
+
+        # Reuse this session's controllers across reruns, they only need
+        # rebuilding when a refreshed token gave us a new Drive service
+        main_controller = st.session_state.get("main_controller")
+        if (
+            main_controller is None
+            or main_controller.drive_service is not drive_service
+        ):
+            main_controller = MainController(
+                drive_service,
+                st.session_state.user["name"],
+                st.session_state.user["email"],
+                creds,
+            )
+            st.session_state.main_controller = main_controller
+
+        main_controller.start()
+
+        if AuthView.show_logout_button():
+            self.logout()
 
     def show_login(self):
-        auth_url = self.handler.get_auth_url()
-        self.view.show_login(
+        # Any session cookie still around points at a login that is gone,
+        # e.g. after logging out
+        logged_out = st.session_state.pop("expire_session_cookie", False)
+        if logged_out or st.context.cookies.get(SESSION_COOKIE):
+            AuthView.expire_cookie(SESSION_COOKIE)
+
+        # Each session gets its own URL, and so its own OAuth state; it is
+        # kept so the login page doesn't regenerate it on every rerun
+        auth_url = st.session_state.get("auth_url")
+        if auth_url is None:
+            auth_url = self.handler.get_auth_url()
+            st.session_state.auth_url = auth_url
+        AuthView.show_login(
             title="📁 GDrive Asset Manager",
             message="Welcome! Please log in with your Google account.",
             auth_url=auth_url,
         )
 
+    def restore_session(self):
+        """
+        Restore a login kept by an earlier session of this browser.
+
+        Returns:
+            bool: True if a stored login was found and restored.
+        """
+        session_key = st.context.cookies.get(SESSION_COOKIE)
+        if not session_key:
+            return False
+        with get_session_store_lock():
+            stored = get_session_store().get(session_key)
+        if not stored:
+            return False
+
+        st.session_state.credentials = stored["credentials"]
+        st.session_state.user = stored["user"]
+        st.session_state.authenticated = True
+        st.session_state.session_key = session_key
+        # The browser already has this cookie
+        st.session_state.session_cookie_set = True
+        return True
+
+    def logout(self):
+        """Forget this browser's login and expire its session cookie."""
+        st.session_state.expire_session_cookie = True
+        self.reset_session()
+
     def reset_session(self):
-        st.session_state.auth = {
-            "credentials": None,
-            "user": None,
-            "authenticated": False,
-        }
+        with get_session_store_lock():
+            get_session_store().pop(st.session_state.get("session_key"), None)
+        for key in AUTH_SESSION_KEYS:
+            if key in st.session_state:
+                del st.session_state[key]
         st.rerun()
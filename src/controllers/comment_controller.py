@@ -1,30 +1,54 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
 from views.comment_ui import CommentUI
 from handlers.comments_handler import CommentsHandler
 import streamlit as st
 
+# Number of comments rendered per page of the comments container
+COMMENTS_PAGE_SIZE = 25
+
+# File extensions that get an image preview
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+logger = logging.getLogger(__name__)
+
+
+@st.cache_resource
+def get_prefetch_executor():
+    """Worker threads shared by all sessions for prefetching comments."""
+    return ThreadPoolExecutor(max_workers=4)
+
 
 class CommentController:
-    def __init__(self, drive_service, user_name):
+    def __init__(self, drive_service, user_name, user_email):
         """
         Initialize the Comment Controller with the necessary services
         and UI components.
         """
-        self.handler = CommentsHandler(drive_service, user_name)
+        self.handler = CommentsHandler(drive_service, user_name, user_email)
         self.ui = CommentUI(user_name)
 
     def _initialize_session_state(self):
         """Initialize all required session state variables with default values."""
+        # Nothing removes these keys again, so only set them on the first run
+        if st.session_state.get("_comment_state_initialized"):
+            return
+
         defaults = {
             # Core selection states
             "selected_file": None,
             "selected_version": None,
             "comments": None,
+            "comment_index": None,
             "all_files": None,
             "all_versions": None,
             # Search and filter states
             "search_term_files": "",
             "searched_files": None,
             "filter_criteria": None,
+            "comment_page": 0,
             # UI reset keys
             "files_reset_key": 0,
             "versions_reset_key": 0,
@@ -36,6 +60,7 @@ class CommentController:
 
         for key, value in defaults.items():
             st.session_state.setdefault(key, value)
+        st.session_state._comment_state_initialized = True
 
     def start(self, width_ratio=3):
         """Handle comments for the selected file version."""
@@ -52,42 +77,59 @@ class CommentController:
         self.ui.display_title()
 
         col_selection, col_comments = st.columns([1, width_ratio])
-        col_empty, col_chat_input = st.columns([1, width_ratio])
 
         with col_selection:
             self._handle_and_display_files()
             self._handle_and_display_versions()
 
+        # Without a file and version there is nothing to show or comment on,
+        # so skip the comments widgets and the chat input row entirely
+        if (
+            not st.session_state.selected_file
+            or not st.session_state.selected_version
+        ):
+            with col_comments:
+                st.info("Please select a file and version to comment on.")
+            return
+
         with col_comments:
             self._handle_and_display_comments()
 
+        col_empty, col_chat_input = st.columns([1, width_ratio])
         with col_chat_input:
             self._handle_and_display_new_comment()
 
     def _clear_session_keys(self, keys):
         """Clear specific keys from session state."""
-        for key in keys:
-            if key in st.session_state:
-                st.session_state[key] = None
+        # One update call instead of a proxy write per key. The keys are
+        # set to None rather than deleted, the defaults are only set once.
+        st.session_state.update(
+            dict.fromkeys(key for key in keys if key in st.session_state)
+        )
 
     def _handle_and_display_files(self):
         """Handle and display the files, with search functionality."""
 
-        # Update search_term_files in session state immediately when search changes
+        # text_input only submits on Enter or blur, so this runs once per
+        # search rather than per keystroke. Surrounding whitespace is ignored
+        # so it doesn't trigger another Drive query, and the new term is used
+        # in this same run instead of forcing an extra rerun.
         new_search_term = self.ui.display_searchbar_files(
             placeholder="Search files..."
-        )
+        ).strip()
 
         if new_search_term != st.session_state.search_term_files:
             st.session_state.search_term_files = new_search_term
-            st.rerun()
 
         if self.ui.display_button(
             key="refresh_files",
             label=":material/refresh:",
             help="Refresh files",
         ):
-            self._clear_session_keys(["all_files", "searched_files"])
+            self.handler.clear_files_cache()
+            self._clear_session_keys(
+                ["all_files", "searched_files", "files_memo", "versions_memo"]
+            )
             st.rerun()
 
         # Determine which files to display based on search
@@ -119,10 +161,17 @@ class CommentController:
                 st.session_state.last_search_term = search_term
 
     def _handle_recent_files(self):
-        """Handle fetching recent files if not already loaded."""
-        if st.session_state.all_files is None:
+        """Handle fetching recent files, remembered per project folder."""
+        project_key = (
+            st.session_state.selected_drive["id"],
+            st.session_state.selected_project_folder["id"],
+        )
+        files_memo = st.session_state.get("files_memo") or {}
+        if project_key not in files_memo:
             gds_files = self.handler.get_recent_files_in_project()
-            st.session_state.all_files = self._process_and_map_files(gds_files)
+            files_memo[project_key] = self._process_and_map_files(gds_files)
+        st.session_state.files_memo = files_memo
+        st.session_state.all_files = files_memo[project_key]
 
     def _process_and_map_files(self, gds_files):
         """Common method to process files and map folder info."""
@@ -138,11 +187,9 @@ class CommentController:
             }
         )
 
-        folders_with_name = self.handler.get_folders_info(
-            folder_ids, fields="id, name"
-        )
+        folder_name_map = self.handler.get_folder_name_map(folder_ids)
         return self.handler.add_folder_info_to_files(
-            gds_files, folders_with_name
+            gds_files, folder_name_map=folder_name_map
         )
 
     def _display_file_selection(self, files_to_display):
@@ -170,6 +217,7 @@ class CommentController:
                 "selected_version",
                 "comments",
                 "filter_criteria",
+                "comment_page",
                 "all_versions",
                 "version_preview_content",
                 "last_selected_version_id",
@@ -206,12 +254,41 @@ class CommentController:
             or st.session_state.last_selected_file != selected_file
         ):
             with st.spinner("Loading versions..."):
-                st.session_state.all_versions = (
-                    self.handler.get_sorted_versions_of_a_file(selected_file)
-                )
+                # Remembered per file, so reselecting a file is instant
+                versions_memo = st.session_state.get("versions_memo") or {}
+                if selected_file["id"] not in versions_memo:
+                    versions_memo[selected_file["id"]] = (
+                        self.handler.get_sorted_versions_of_a_file(
+                            selected_file
+                        )
+                    )
+                st.session_state.versions_memo = versions_memo
+                st.session_state.all_versions = versions_memo[
+                    selected_file["id"]
+                ]
                 st.session_state.last_selected_file = selected_file
                 st.session_state.version_preview_content = None
                 st.session_state.last_selected_version_id = None
+                self._prefetch_comments(selected_file)
+
+    def _prefetch_comments(self, selected_file):
+        """
+        Start loading the comments of the preselected (newest) version in
+        the background, so MongoDB is queried while the preview downloads.
+        """
+        versions = st.session_state.all_versions
+        if not versions:
+            st.session_state.pending_comments = None
+            return
+
+        st.session_state.pending_comments = (
+            (selected_file["id"], versions[0]["id"]),
+            get_prefetch_executor().submit(
+                self.handler.get_comments_of_version,
+                selected_file,
+                versions[0],
+            ),
+        )
 
     def _handle_version_change(self, selected_version):
         """Handle state changes when version selection changes."""
@@ -220,7 +297,12 @@ class CommentController:
             and st.session_state.selected_version != selected_version
         ):
             self._clear_session_keys(
-                ["comments", "filter_criteria", "version_preview_content"]
+                [
+                    "comments",
+                    "filter_criteria",
+                    "comment_page",
+                    "version_preview_content",
+                ]
             )
             st.session_state["comments_reset_key"] = (
                 st.session_state.get("comments_reset_key", 0) + 1
@@ -271,10 +353,9 @@ class CommentController:
     @staticmethod
     def _is_image_file(filename):
         """Check if the filename indicates an image file."""
-        return any(
-            ext in filename.lower()
-            for ext in [".jpg", ".jpeg", ".png", ".gif"]
-        )
+        # The newest version carries a " (current version)" label
+        name = filename.lower().removesuffix(" (current version)")
+        return name.endswith(IMAGE_EXTENSIONS)
 
     def _handle_and_display_comments(self):
         """Main method to handle and display comments."""
@@ -295,10 +376,60 @@ class CommentController:
             "comments" not in st.session_state
             or st.session_state.comments is None
         ):
-            st.session_state.comments = self.handler.get_comments_of_version(
-                st.session_state.selected_file,
-                st.session_state.selected_version,
+            selected_key = (
+                st.session_state.selected_file["id"],
+                st.session_state.selected_version["id"],
             )
+            pending = st.session_state.get("pending_comments")
+            st.session_state.pending_comments = None
+
+            if pending and pending[0] == selected_key:
+                st.session_state.comments = pending[1].result()
+            else:
+                st.session_state.comments = (
+                    self.handler.get_comments_of_version(
+                        st.session_state.selected_file,
+                        st.session_state.selected_version,
+                    )
+                )
+            st.session_state.comment_index = self._build_comment_index(
+                st.session_state.comments
+            )
+
+    @staticmethod
+    def _build_comment_index(comments):
+        """
+        Index the loaded comments for filtering and lookups: positions by
+        status and user, lowercased text, comments by id and replies by id
+        together with the id of their parent comment.
+        """
+        index = {
+            "by_status": {True: [], False: []},
+            "by_user": defaultdict(list),
+            "text": [],
+            "by_id": {},
+            "replies_by_id": {},
+        }
+        for position, comment in enumerate(comments or []):
+            index["by_status"][comment.get("resolved", False)].append(position)
+            index["by_user"][comment["user"]].append(position)
+            index["text"].append(comment["content"].lower())
+            index["by_id"][comment["id"]] = comment
+            for reply in comment.get("replies", []):
+                index["replies_by_id"][reply["id"]] = (comment["id"], reply)
+        return index
+
+    def _get_comment_index(self):
+        """Return the comment index, rebuilding it if it was dropped."""
+        if st.session_state.get("comment_index") is None:
+            st.session_state.comment_index = self._build_comment_index(
+                st.session_state.comments
+            )
+        return st.session_state.comment_index
+
+    def _invalidate_comment_index(self):
+        """Drop the comment index after the comments list has changed."""
+        st.session_state.comment_index = None
 
     def _display_comments(self):
         if st.session_state.get("comments") is not None:
@@ -312,9 +443,28 @@ class CommentController:
                 filtered_comments = self._get_filtered_comments()
 
                 if filtered_comments:
-                    for comment in filtered_comments:
+                    # Only render one page of comments to keep the widget
+                    # count per rerun bounded
+                    page_count = math.ceil(
+                        len(filtered_comments) / COMMENTS_PAGE_SIZE
+                    )
+                    page = min(
+                        st.session_state.get("comment_page") or 0,
+                        page_count - 1,
+                    )
+                    start = page * COMMENTS_PAGE_SIZE
+                    for comment in filtered_comments[
+                        start : start + COMMENTS_PAGE_SIZE
+                    ]:
                         action = self.ui.display_comment(comment)
                         self._handle_comment_action(action)
+
+                    new_page = self.ui.display_comment_pagination(
+                        page, page_count
+                    )
+                    if new_page is not None:
+                        st.session_state.comment_page = new_page
+                        st.rerun()
                 else:
                     st.warning("No comments match the selected filters.")
             else:
@@ -330,21 +480,26 @@ class CommentController:
             st.session_state.comments
         )
 
+        # Nothing was applied in this run
+        if filter_criteria is None:
+            return
+
         # If filters were cleared (empty search text and 'all' for other filters)
         if (
-            filter_criteria
-            and filter_criteria.get("search_text") == ""
+            filter_criteria.get("search_text") == ""
             and filter_criteria.get("status") == "all"
             and filter_criteria.get("user_filter") == "all"
         ):
-            # Clear filter-related session state
-            st.session_state.filter_criteria = None
-            st.session_state.filter_criteria = None
-            st.rerun()
-        elif filter_criteria is not None:
-            # Update filter criteria in session state
-            st.session_state.filter_criteria = filter_criteria
-            st.rerun()
+            filter_criteria = None
+
+        # Applying the same filters again keeps the current page
+        if filter_criteria == st.session_state.get("filter_criteria"):
+            return
+
+        # The comments container is drawn after the filters, so the new
+        # criteria already apply in this run without a rerun.
+        st.session_state.filter_criteria = filter_criteria
+        st.session_state.comment_page = 0
 
     def _get_filtered_comments(self):
         """Apply filters to comments based on session state criteria."""
@@ -358,35 +513,40 @@ class CommentController:
             "user_filter": "all",
         }
 
-        filtered_comments = st.session_state.comments.copy()
+        comments = st.session_state.comments
+        index = self._get_comment_index()
+
+        # Positions of the comments that pass the filters, None means all
+        positions = None
 
         # Apply status filter
         if filter_criteria.get("status", "all") != "all":
             resolved_status = filter_criteria["status"] == "resolved"
-            filtered_comments = [
-                c
-                for c in filtered_comments
-                if c.get("resolved", False) == resolved_status
-            ]
+            positions = index["by_status"][resolved_status]
 
         # Apply user filter
         if filter_criteria.get("user_filter", "all") != "all":
-            filtered_comments = [
-                c
-                for c in filtered_comments
-                if c["user"] == filter_criteria["user_filter"]
-            ]
+            user_positions = index["by_user"].get(
+                filter_criteria["user_filter"], []
+            )
+            if positions is None:
+                positions = user_positions
+            else:
+                positions = sorted(set(positions).intersection(user_positions))
 
         # Apply search text filter
         if filter_criteria.get("search_text", ""):
             search_text = filter_criteria["search_text"].lower()
-            filtered_comments = [
-                c
-                for c in filtered_comments
-                if search_text in c["content"].lower()
+            if positions is None:
+                positions = range(len(comments))
+            positions = [
+                i for i in positions if search_text in index["text"][i]
             ]
 
-        return filtered_comments
+        # No filter active, the list is only read so no copy is needed
+        if positions is None:
+            return comments
+        return [comments[i] for i in positions]
 
     def _handle_comment_action(self, action):
         """Handle comment actions"""
@@ -418,10 +578,7 @@ class CommentController:
 
     def _confirm_and_delete_comment(self, comment_id):
         """Handle the confirmation and deletion of a comment."""
-        comment_to_delete = next(
-            (c for c in st.session_state.comments if c["id"] == comment_id),
-            None,
-        )
+        comment_to_delete = self._get_comment_index()["by_id"].get(comment_id)
         if not comment_to_delete:
             return
 
@@ -447,7 +604,7 @@ class CommentController:
             st.session_state.comments = [
                 c for c in st.session_state.comments if c["id"] != comment_id
             ]
-            st.rerun()
+            self._invalidate_comment_index()
 
     def _handle_comment_resolve(self, comment_id, resolved):
         """Handle resolving or unresolving a comment."""
@@ -459,10 +616,10 @@ class CommentController:
                 resolved,
             )
             # Update the comment's resolved status in session state
-            for comment in st.session_state.comments:
-                if comment["id"] == comment_id:
-                    comment["resolved"] = resolved
-                    break
+            comment = self._get_comment_index()["by_id"].get(comment_id)
+            if comment:
+                comment["resolved"] = resolved
+            self._invalidate_comment_index()
             st.rerun()
 
     def _handle_and_display_new_comment(self):
@@ -490,15 +647,13 @@ class CommentController:
 
                 if new_comment:
                     st.session_state.comments.append(new_comment)
+                    self._invalidate_comment_index()
                     st.rerun()
 
     def _handle_comment_edit(self, comment_id):
         """Handle the editing of a comment's content."""
         # Find the comment to edit
-        comment_to_edit = next(
-            (c for c in st.session_state.comments if c["id"] == comment_id),
-            None,
-        )
+        comment_to_edit = self._get_comment_index()["by_id"].get(comment_id)
 
         if not comment_to_edit:
             st.error("Comment not found")
@@ -518,6 +673,7 @@ class CommentController:
                         )
                         # Update the comment in session state
                         comment_to_edit["content"] = new_content
+                        self._invalidate_comment_index()
                         st.success("Comment updated successfully!")
                         st.rerun()
                     except Exception as e:
@@ -533,10 +689,7 @@ class CommentController:
     def _handle_comment_reply(self, comment_id):
         """Handle the editing of a comment's content."""
         # Find the comment to edit
-        comment_to_reply = next(
-            (c for c in st.session_state.comments if c["id"] == comment_id),
-            None,
-        )
+        comment_to_reply = self._get_comment_index()["by_id"].get(comment_id)
 
         if not comment_to_reply:
             st.error("Comment not found")
@@ -556,12 +709,15 @@ class CommentController:
                         )
 
                         # Update the comment in session state with the new reply
-                        for comment in st.session_state.comments:
-                            if comment["id"] == comment_id:
-                                comment.setdefault("replies", []).append(
-                                    new_reply
-                                )
-                                break
+                        comment_to_reply.setdefault("replies", []).append(
+                            new_reply
+                        )
+                        # Replies don't affect the filters, only the
+                        # reply lookup needs the new entry
+                        if new_reply:
+                            self._get_comment_index()["replies_by_id"][
+                                new_reply["id"]
+                            ] = (comment_id, new_reply)
 
                         st.success("Successfully replied to comment!")
                         st.rerun()
@@ -578,17 +734,13 @@ class CommentController:
 
     def _confirm_and_delete_reply(self, reply_id):
         """Handle the confirmation and deletion of a reply."""
-        reply_to_delete = None
-        for comment in st.session_state.get("comments", []):
-            for reply in comment.get("replies", []):
-                if reply["id"] == reply_id:
-                    reply_to_delete = reply
-                    break
-            if reply_to_delete:
-                break
+        if not st.session_state.get("comments"):
+            return
 
-        if not reply_to_delete:
+        entry = self._get_comment_index()["replies_by_id"].get(reply_id)
+        if not entry:
             return
+        _, reply_to_delete = entry
 
         def on_confirm():
             self._handle_reply_deletion(reply_id)
@@ -610,13 +762,17 @@ class CommentController:
             )
 
             # Update the session state comments by filtering out the deleted reply
-            for comment in st.session_state.get("comments", []):
-                comment.setdefault("replies", [])
+            index = self._get_comment_index()
+            entry = index["replies_by_id"].get(reply_id)
+            if entry:
+                parent_id, _ = entry
+                comment = index["by_id"][parent_id]
                 comment["replies"] = [
-                    r for r in comment["replies"] if r["id"] != reply_id
+                    r
+                    for r in comment.get("replies", [])
+                    if r["id"] != reply_id
                 ]
-
-        st.rerun()
+                del index["replies_by_id"][reply_id]
 
     def _handle_version_download(self, selected_file, selected_version):
         """Handle downloading of a selected version."""
@@ -631,7 +787,7 @@ class CommentController:
                 file_bytes, mime_type = self.handler.get_version_content(
                     file_id, version_id
                 )
-                print("mime_type", mime_type)
+                logger.debug("Prepared download with mime type %s", mime_type)
                 if file_bytes:
                     # Determine filename
                     if selected_version.get("name"):
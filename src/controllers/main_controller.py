@@ -1,12 +1,24 @@
-from controllers.comment_controller import CommentController
-from controllers.version_control_controller import VersionControlController
 from controllers.selection_controller import SelectionController
 from streamlit_option_menu import option_menu
 import streamlit as st
 
+# Comments page state that is cleared when coming back from Version Control,
+# where files and versions may have been uploaded, renamed, moved or trashed.
+COMMENTS_SWITCH_KEYS = (
+    "selected_file",
+    "selected_version",
+    "comments",
+    "all_files",
+    "files_memo",
+    "searched_files",
+    "all_versions",
+    "versions_memo",
+    "filter_criteria",
+)
+
 
 class MainController:
-    def __init__(self, drive_service, user_name, user_email):
+    def __init__(self, drive_service, user_name, user_email, credentials):
         """
         Initialize the Main Controller.
         Assumes authentication has already been handled.
@@ -14,6 +26,7 @@ class MainController:
         self.drive_service = drive_service
         self.user_name = user_name
         self.user_email = user_email
+        self.credentials = credentials
 
         self.selection_controller = None
         self.comment_controller = None
@@ -25,9 +38,10 @@ class MainController:
         """
 
         # Initialize the Selection Controller first
-        self.selection_controller = SelectionController(
-            self.drive_service, self.user_name
-        )
+        if self.selection_controller is None:
+            self.selection_controller = SelectionController(
+                self.drive_service, self.user_name, self.user_email
+            )
 
         # Set default page to "Version Control"
         if "selected_page" not in st.session_state:
@@ -53,7 +67,7 @@ class MainController:
         if not self._has_valid_selections():
             return
 
-        self._init_other_controllers()
+        self._init_other_controllers(current_page)
 
         if current_page == "Comments":
             self.comment_controller.start(width_ratio=3)
@@ -64,17 +78,16 @@ class MainController:
         """Clear relevant session state when switching between pages."""
         if previous_page == "Version Control" and current_page == "Comments":
             # Clear file and version selection state when coming back to Comments
-            keys_to_clear = [
-                "selected_file",
-                "selected_version",
-                "comments",
-                "all_files",
-                "all_versions",
-                "filter_criteria",
-            ]
-            for key in keys_to_clear:
-                if key in st.session_state:
-                    st.session_state[key] = None
+            from handlers.comments_handler import clear_listings_cache
+
+            clear_listings_cache(self.user_email)
+            st.session_state.update(
+                dict.fromkeys(
+                    key
+                    for key in COMMENTS_SWITCH_KEYS
+                    if key in st.session_state
+                )
+            )
 
     def _has_valid_selections(self):
         """
@@ -93,17 +106,28 @@ class MainController:
             return False
         return True
 
-    def _init_other_controllers(self):
+    def _init_other_controllers(self, current_page):
         """
-        Initialize the other controllers only when needed.
+        Initialize the controller of the current page only when needed.
+        The controllers are imported here so a page doesn't load the
+        modules of the other one.
         """
-        if self.comment_controller is None:
+        if current_page == "Comments" and self.comment_controller is None:
+            from controllers.comment_controller import CommentController
+
             self.comment_controller = CommentController(
-                self.drive_service, self.user_name
+                self.drive_service, self.user_name, self.user_email
             )
-        if self.version_controller is None:
+        if (
+            current_page == "Version Control"
+            and self.version_controller is None
+        ):
+            from controllers.version_control_controller import (
+                VersionControlController,
+            )
+
             self.version_controller = VersionControlController(
-                self.drive_service, self.user_name
+                self.drive_service, self.user_name, self.credentials
             )
 
     def _display_navigation_sidebar(self):
@@ -4,16 +4,17 @@ import streamlit as st
 
 
 class SelectionController:
-    def __init__(self, drive_service, user_name):
+    def __init__(self, drive_service, user_name, user_email):
         """
         Initialize the Selection Controller.
 
         Args:
             drive_service: The Google Drive service instance.
             user_name (str): The name of the user.
+            user_email (str): The email of the user.
         """
         self.ui = SelectionUI()
-        self.handler = SelectionHandler(drive_service, user_name)
+        self.handler = SelectionHandler(drive_service, user_name, user_email)
         self._initialize_session_state()
 
     def _initialize_session_state(self):
@@ -1,13 +1,24 @@
+from operator import itemgetter
 import streamlit as st
 from views.version_control_ui import VersionControlUI
 from handlers.version_control_handler import VersionControlHandler
 
+# Session state reset after files or versions were changed
+FILES_STATE_KEYS = (
+    "selected_file",
+    "files_for_display",
+    "batch_selected_files",
+    "search_term_files",
+)
+VERSIONS_STATE_KEYS = ("selected_version", "batch_selected_versions")
+
 
 class VersionControlController:
     def __init__(
         self,
         drive_service,
         user_name,
+        credentials,
         border=True,
     ):
         """
@@ -16,6 +27,7 @@ class VersionControlController:
         Args:
             drive_service: The Google Drive service instance.
             user_name (str): The name of the user.
+            credentials (Credentials): The user's Google credentials.
             border (bool): Whether to display borders in the UI.
         """
         self.border = border
@@ -24,6 +36,7 @@ class VersionControlController:
         self.handler = VersionControlHandler(
             drive_service,
             user_name,
+            credentials,
         )
 
     def _initialize_session_state(self):
@@ -53,6 +66,7 @@ class VersionControlController:
         Runs the application by connecting the UI and Handler.
         """
         self._initialize_session_state()
+        self._report_finished_cleanups()
 
         st.title("Version Control", anchor="False")
 
@@ -262,11 +276,9 @@ class VersionControlController:
                         if parent is not None
                     }
                 )
-                folder_info = self.handler.get_folders_info(
-                    folder_ids, fields="id, name"
-                )
+                folder_names = self.handler.get_folder_name_map(folder_ids)
                 files_for_display = self.handler.format_files_for_display(
-                    files_from_gd, folder_info
+                    files_from_gd, folder_names
                 )
 
                 # Save in session state
@@ -642,17 +654,15 @@ class VersionControlController:
                 if parent is not None
             }
         )
-        folder_info = self.handler.get_folders_info(
-            folder_ids, fields="id, name"
-        )
+        folder_names = self.handler.get_folder_name_map(folder_ids)
 
         trashed_files_with_folder = self.handler.format_files_for_display(
-            trashed_files, folder_info
+            trashed_files, folder_names
         )
 
         # Sort files by modified time in descending order
         trashed_files_with_folder.sort(
-            key=lambda x: x["modifiedTime"], reverse=True
+            key=itemgetter("modifiedTime"), reverse=True
         )
 
         try:
@@ -855,16 +865,13 @@ class VersionControlController:
             f"Preparing {len(batch_selected_versions)} version(s) "
             "for download..."
         ):
-            file_data_list = []
-            for version in batch_selected_versions:
-                version_id = version.get("id")
-                if not version_id:
-                    continue
-
-                file_bytes, mime_type = self.handler.get_revision_as_bytes(
-                    file_id, version_id
-                )
+            versions = [v for v in batch_selected_versions if v.get("id")]
+            downloads = self.handler.get_revisions_as_bytes(
+                file_id, [version["id"] for version in versions]
+            )
 
+            file_data_list = []
+            for version, (file_bytes, mime_type) in zip(versions, downloads):
                 # Determine filename
                 if version.get("originalFilename"):
                     file_name = version["originalFilename"]
@@ -891,16 +898,24 @@ class VersionControlController:
             # Create zip file if multiple versions,
             # or download single file directly
             if len(file_data_list) > 1:
-                zip_buffer = self.handler.create_zip_file(file_data_list)
                 base_name = st.session_state.selected_file.get(
                     "name", "versions"
                 )
                 min_version = min(v["versionNumber"] for v in file_data_list)
                 max_version = max(v["versionNumber"] for v in file_data_list)
                 zip_name = f"{base_name}_v{min_version}-{max_version}.zip"
+                file_count = len(file_data_list)
+
+                # Only file_data_list may still hold the downloaded
+                # versions, so clearing it below actually frees them
+                del downloads, file_bytes
+                zip_buffer = self.handler.create_zip_file(file_data_list)
+                # The versions are in the zip now, let them be freed before
+                # the download button copies the zip
+                file_data_list.clear()
 
                 self.ui.show_download_button_zip(
-                    zip_buffer, zip_name, len(file_data_list)
+                    zip_buffer, zip_name, file_count
                 )
 
             else:
@@ -935,15 +950,13 @@ class VersionControlController:
             def on_rename_callback(new_names):
                 """Callback function to handle the rename operation."""
                 success_count = 0
-                for file_id, new_name in new_names.items():
-                    with st.spinner(f"Renaming file to {new_name}..."):
-                        success, message = self.handler.rename_file(
-                            file_id, new_name
-                        )
-                        if success:
-                            success_count += 1
-                        else:
-                            self.ui.display_feedback_message(success, message)
+                with st.spinner(f"Renaming {len(new_names)} file(s)..."):
+                    results = self.handler.rename_files(new_names)
+                for success, message in results.values():
+                    if success:
+                        success_count += 1
+                    else:
+                        self.ui.display_feedback_message(success, message)
 
                 self.ui.display_feedback_message(
                     True if success_count == len(new_names) else False,
@@ -996,21 +1009,19 @@ class VersionControlController:
 
             def on_toggle_callback(keep_forever):
                 success_count = 0
-                for version in batch_selected_versions:
-                    with st.spinner(
-                        f"Updating version {version['versionNumber']}..."
-                    ):
-                        success, message = (
-                            self.handler.update_version_keep_forever(
-                                selected_file["id"],
-                                version["id"],
-                                keep_forever,
-                            )
-                        )
-                        if success:
-                            success_count += 1
-                        else:
-                            self.ui.display_feedback_message(success, message)
+                with st.spinner(
+                    f"Updating {len(batch_selected_versions)} version(s)..."
+                ):
+                    results = self.handler.update_versions_keep_forever(
+                        selected_file["id"],
+                        [version["id"] for version in batch_selected_versions],
+                        keep_forever,
+                    )
+                for success, message in results.values():
+                    if success:
+                        success_count += 1
+                    else:
+                        self.ui.display_feedback_message(success, message)
 
                 self.ui.display_feedback_message(
                     success_count > 0,
@@ -1028,52 +1039,51 @@ class VersionControlController:
                 False, f"Error updating versions: {str(e)}"
             )
 
+    def _report_finished_cleanups(self):
+        """
+        Reports the background deletions of old versions that finished
+        and drops the versions listed for those files, so they are fetched
+        again without the deleted versions.
+        """
+        for file_id, error in self.handler.pop_finished_cleanups():
+            st.session_state.pop(f"versions_for_file_{file_id}", None)
+            if error is not None:
+                self.ui.display_feedback_message(
+                    False, f"Failed to delete older versions: {str(error)}"
+                )
+
     def _clear_files_session_state(self):
         """Clears all session state related to files."""
+        ss = st.session_state
+
         # Clear cache
-        drive_id = st.session_state.get("selected_drive", {}).get("id")
-        project_folder_id = st.session_state.get(
-            "selected_project_folder", {}
-        ).get("id")
-        search_term = st.session_state.get("search_term_files")
+        drive_id = (ss.get("selected_drive") or {}).get("id")
+        project_folder_id = (ss.get("selected_project_folder") or {}).get("id")
 
         if drive_id and project_folder_id:
+            search_term = ss.get("search_term_files")
             cache_key = f"files_{drive_id}_{project_folder_id}_{search_term}"
-            if cache_key in st.session_state:
-                del st.session_state[cache_key]
+            ss.pop(cache_key, None)
 
         # Clear file states
-        keys_to_clear = [
-            "selected_file",
-            "files_for_display",
-            "batch_selected_files",
-            "search_term_files",
-        ]
-        for key in keys_to_clear:
-            if key in st.session_state:
-                st.session_state[key] = None
+        ss.update(dict.fromkeys(key for key in FILES_STATE_KEYS if key in ss))
 
         # Increment reset key
-        st.session_state["files_reset_key"] = (
-            st.session_state.get("files_reset_key", 0) + 1
-        )
+        ss["files_reset_key"] = ss.get("files_reset_key", 0) + 1
 
     def _clear_versions_session_state(self):
         """Clears all session state related to versions."""
+        ss = st.session_state
+
         # Clear cache
-        selected_file = st.session_state.get("selected_file")
+        selected_file = ss.get("selected_file")
         if selected_file and selected_file.get("id"):
-            cache_key = f"versions_for_file_{selected_file['id']}"
-            if cache_key in st.session_state:
-                del st.session_state[cache_key]
+            ss.pop(f"versions_for_file_{selected_file['id']}", None)
 
         # Clear version states
-        keys_to_clear = ["selected_version", "batch_selected_versions"]
-        for key in keys_to_clear:
-            if key in st.session_state:
-                st.session_state[key] = None
+        ss.update(
+            dict.fromkeys(key for key in VERSIONS_STATE_KEYS if key in ss)
+        )
 
         # Increment reset key
-        st.session_state["versions_reset_key"] = (
-            st.session_state.get("versions_reset_key", 0) + 1
-        )
+        ss["versions_reset_key"] = ss.get("versions_reset_key", 0) + 1
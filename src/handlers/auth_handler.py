@@ -1,62 +1,109 @@
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from google.auth.transport.requests import Request
+import threading
+import streamlit as st
 
-SCOPES = [
+# A tuple, the scopes are shared by every flow and must not change
+SCOPES = (
     "openid",
     "https://www.googleapis.com/auth/userinfo.profile",
     "https://www.googleapis.com/auth/userinfo.email",
     "https://www.googleapis.com/auth/drive",
     "https://www.googleapis.com/auth/drive.file",
     "https://www.googleapis.com/auth/drive.readonly",
-]
+)
+
+
+@st.cache_resource
+def get_refresh_lock():
+    """
+    Process-wide lock so only one thread refreshes a token at a time.
+    Refresh tokens can rotate, parallel refreshes would invalidate each other.
+    """
+    return threading.Lock()
+
+
+def refresh_if_expired(creds):
+    """
+    Refresh expired credentials in place, under the refresh lock.
+
+    Raises:
+        RefreshError: If the token can't be refreshed.
+    """
+    if creds.expired and creds.refresh_token:
+        with get_refresh_lock():
+            # Another thread may have refreshed it while we waited
+            if creds.expired:
+                creds.refresh(Request())
+    return creds
+
+
+def _first(profile, key, field, default):
+    """Return a field of the first entry of a profile list, or default."""
+    entries = profile.get(key)
+    return entries[0].get(field, default) if entries else default
 
 
 class AuthHandler:
     def __init__(self, client_config, redirect_uri):
         self.client_config = client_config
         self.redirect_uri = redirect_uri
-        self.flow = None
 
-    def initialize_flow(self):
-        self.flow = Flow.from_client_config(
+    def _create_flow(self):
+        # Imported here, the login page only needs it once the URL is built
+        from google_auth_oauthlib.flow import Flow
+
+        return Flow.from_client_config(
             client_config=self.client_config,
             scopes=SCOPES,
             redirect_uri=self.redirect_uri,
         )
-        return self.flow
 
     def fetch_token(self, code):
-        if not self.flow:
-            self.initialize_flow()
-        return self.flow.fetch_token(code=code)
+        """
+        Exchange an authorization code for credentials.
 
-    def get_credentials(self):
-        return self.flow.credentials if self.flow else None
+        A fresh flow is used for every exchange because the handler is
+        shared between sessions, so the token must never be kept on it.
+        """
+        flow = self._create_flow()
+        flow.fetch_token(code=code)
+        return flow.credentials
 
     def get_auth_url(self):
-        if not self.flow:
-            self.initialize_flow()
-        return self.flow.authorization_url(
+        """
+        Build a sign-in URL with a fresh OAuth state. Like fetch_token it
+        uses its own flow, the handler is shared between sessions.
+        """
+        return self._create_flow().authorization_url(
             prompt="consent",
             access_type="offline",
             include_granted_scopes="false",
         )[0]
 
     def get_user_info(self, creds):
-        people_service = build("people", "v1", credentials=creds)
+        from googleapiclient.discovery import build
+
+        people_service = build(
+            "people", "v1", credentials=creds, static_discovery=True
+        )
         profile = (
             people_service.people()
-            .get(resourceName="people/me", personFields="names,emailAddresses")
+            .get(
+                resourceName="people/me",
+                personFields="names,emailAddresses",
+                fields="names(displayName),emailAddresses(value)",
+            )
             .execute()
         )
         return {
-            "name": profile.get("names", [{}])[0].get(
-                "displayName", "Unknown"
-            ),
-            "email": profile.get("emailAddresses", [{}])[0].get(
-                "value", "unknown"
-            ),
+            "name": _first(profile, "names", "displayName", "Unknown"),
+            "email": _first(profile, "emailAddresses", "value", "unknown"),
         }
 
     def build_drive_service(self, creds):
-        return build("drive", "v3", credentials=creds, static_discovery=False)
+        # Imported here so the login page doesn't load the API client
+        from googleapiclient.discovery import build
+
+        # The client library ships the Drive discovery document, using it
+        # saves fetching it from Google on every login
+        return build("drive", "v3", credentials=creds, static_discovery=True)
@@ -16,28 +16,177 @@ from models.google_drive_utils import (
     gds_download_version_image,
     gds_get_file_revision_as_bytes,
 )
-from datetime import datetime
+from cachetools import TTLCache
+from operator import itemgetter
+import threading
+import time
+
+# Format of the timestamps stored with comments and replies
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# How long Drive file listings are reused across reruns (seconds)
+FILES_CACHE_TTL = 300
+
+# Revision contents never change, so downloads can be kept longer
+CONTENT_CACHE_TTL = 1800
+
+# Total size of the downloads kept in memory by all sessions, and the size
+# above which a download isn't kept at all
+CONTENT_CACHE_BYTES = 128 * 1024 * 1024
+MAX_CACHED_CONTENT_SIZE = 8 * 1024 * 1024
+
+
+@st.cache_resource
+def _listing_generations():
+    """
+    Per-user counters passed to the cached listings below. Bumping a
+    user's counter makes their next fetches miss the cache, without
+    dropping the cached results of other users.
+    """
+    return {}
+
+
+def _listing_generation(user_email):
+    return _listing_generations().get(user_email, 0)
+
+
+def clear_listings_cache(user_email):
+    """Drop a user's cached file and version listings."""
+    generations = _listing_generations()
+    generations[user_email] = generations.get(user_email, 0) + 1
+
+
+# The drive service is passed with a leading underscore so Streamlit doesn't
+# try to hash it; user_email keeps the cached results separate per user and
+# generation lets clear_listings_cache invalidate them.
+@st.cache_data(ttl=FILES_CACHE_TTL, max_entries=64, show_spinner=False)
+def _cached_search_files(
+    _drive_service, user_email, generation, drive_id, folder_id, search_term
+):
+    return gds_get_files(
+        service=_drive_service,
+        drive_id=drive_id,
+        fields=("id, name, parents, modifiedTime"),
+        search_term=search_term,
+        folder_id=folder_id,
+    )
+
+
+@st.cache_data(ttl=FILES_CACHE_TTL, max_entries=64, show_spinner=False)
+def _cached_recent_files(
+    _drive_service, user_email, generation, drive_id, folder_id, max_results
+):
+    return gds_get_most_recent_files_recursive(
+        _drive_service,
+        drive_id,
+        folder_id=folder_id,
+        max_results=max_results,
+        fields="id, name, parents, modifiedTime",
+    )
+
+
+@st.cache_data(ttl=FILES_CACHE_TTL, max_entries=64, show_spinner=False)
+def _cached_folders_info(
+    _drive_service, user_email, generation, folder_ids, fields
+):
+    return gds_get_folders_info(
+        _drive_service, list(folder_ids), fields=fields
+    )
+
+
+@st.cache_data(ttl=FILES_CACHE_TTL, max_entries=64, show_spinner=False)
+def _cached_folder_name_map(
+    _drive_service, user_email, generation, folder_ids
+):
+    folders = _cached_folders_info(
+        _drive_service, user_email, generation, folder_ids, "id, name"
+    )
+    return {folder["id"]: folder["name"] for folder in folders}
+
+
+# A new version changes the file's modifiedTime, which is part of the key
+@st.cache_data(ttl=FILES_CACHE_TTL, max_entries=64, show_spinner=False)
+def _cached_sorted_versions(
+    _drive_service, user_email, generation, file_id, modified_time
+):
+    versions = gds_get_versions_of_a_file(
+        _drive_service,
+        file_id,
+        fields="id, originalFilename, modifiedTime",
+    )
+    return sorted(
+        versions,
+        key=itemgetter("modifiedTime"),
+        reverse=True,
+    )
+
+
+def _content_size(entry):
+    return len(entry[0])
+
+
+# Downloads are bounded by their total size rather than by a number of
+# entries, so a few large revisions can't pin gigabytes in memory. The
+# cached bytes objects are handed out as is, without copying them.
+@st.cache_resource
+def _content_cache():
+    return TTLCache(
+        maxsize=CONTENT_CACHE_BYTES,
+        ttl=CONTENT_CACHE_TTL,
+        getsizeof=_content_size,
+    )
+
+
+@st.cache_resource
+def _content_cache_lock():
+    """The content cache is shared by every session's script thread."""
+    return threading.Lock()
+
+
+def _cached_content(key, download):
+    """
+    Return the (content, mime type) cached under key, downloading and
+    caching it if it's missing and small enough.
+    """
+    with _content_cache_lock():
+        entry = _content_cache().get(key)
+    if entry is None:
+        entry = download()
+        if entry[0] is not None and _content_size(entry) <= (
+            MAX_CACHED_CONTENT_SIZE
+        ):
+            with _content_cache_lock():
+                _content_cache()[key] = entry
+    return entry
+
+
+@st.cache_data(ttl=600, max_entries=128, show_spinner=False)
+def _cached_preview_metadata(_drive_service, user_email, file_id):
+    return (
+        _drive_service.files()
+        .get(
+            fileId=file_id,
+            fields="webViewLink, exportLinks",
+            supportsAllDrives=True,
+        )
+        .execute()
+    )
 
 
 class CommentsHandler:
-    def __init__(self, drive_service, user_name):
+    def __init__(self, drive_service, user_name, user_email):
         """Initialize the comments handler
         with the drive service and user info."""
         self.drive_service = drive_service
         self.user_name = user_name
+        self.user_email = user_email
 
     def get_file_preview_link(self, file_id):
         """Get the preview link
         for a specific version of a file."""
         try:
-            file_metadata = (
-                self.drive_service.files()
-                .get(
-                    fileId=file_id,
-                    fields="webViewLink, exportLinks",
-                    supportsAllDrives=True,
-                )
-                .execute()
+            file_metadata = _cached_preview_metadata(
+                self.drive_service, self.user_email, file_id
             )
             # Check if the file has exportLinks
             # (e.g., for Google Docs, Sheets, etc.)
@@ -61,7 +210,7 @@ class CommentsHandler:
         """Add a new comment to the selected version of the file."""
         file_id = file["id"]
         version_id = version["id"]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = time.strftime(TIMESTAMP_FORMAT)
 
         new_comment = mongo_save_new_comment(
             file_id,
@@ -93,12 +242,13 @@ class CommentsHandler:
         drive_id = st.session_state.selected_drive["id"]
         project_folder_id = st.session_state.selected_project_folder["id"]
 
-        files = gds_get_files(
-            service=self.drive_service,
-            drive_id=drive_id,
-            fields=("id, name, parents, modifiedTime"),
-            search_term=search_term,
-            folder_id=project_folder_id,
+        files = _cached_search_files(
+            self.drive_service,
+            self.user_email,
+            _listing_generation(self.user_email),
+            drive_id,
+            project_folder_id,
+            search_term,
         )
 
         return files
@@ -108,12 +258,13 @@ class CommentsHandler:
         drive_id = st.session_state.selected_drive["id"]
         project_folder_id = st.session_state.selected_project_folder["id"]
 
-        recent_files = gds_get_most_recent_files_recursive(
+        recent_files = _cached_recent_files(
             self.drive_service,
+            self.user_email,
+            _listing_generation(self.user_email),
             drive_id,
-            folder_id=project_folder_id,
-            max_results=max_results,
-            fields="id, name, parents, modifiedTime",
+            project_folder_id,
+            max_results,
         )
 
         return recent_files
@@ -129,64 +280,85 @@ class CommentsHandler:
         Returns:
             list: A list of dictionaries containing folder information.
         """
-        folder_info = gds_get_folders_info(
-            self.drive_service, folder_ids, fields=fields
+        folder_info = _cached_folders_info(
+            self.drive_service,
+            self.user_email,
+            _listing_generation(self.user_email),
+            tuple(sorted(folder_ids)),
+            fields,
         )
 
         return folder_info
 
-    def add_folder_info_to_files(self, files, folders):
+    def get_folder_name_map(self, folder_ids):
+        """
+        Retrieves the names of the specified folders in Google Drive.
+
+        Args:
+            folder_ids (list): A list of folder IDs.
+
+        Returns:
+            dict: A dictionary mapping folder IDs to folder names.
+        """
+        return _cached_folder_name_map(
+            self.drive_service,
+            self.user_email,
+            _listing_generation(self.user_email),
+            tuple(sorted(folder_ids)),
+        )
+
+    def clear_files_cache(self):
+        """Drop this user's cached listings so the next fetch hits Drive."""
+        clear_listings_cache(self.user_email)
+
+    def add_folder_info_to_files(
+        self, files, folders=None, folder_name_map=None
+    ):
         """
         Adds folder_name to each file and renames parents to folder_id.
 
         Args:
             files: List of file dicts with parents array
             folders: List of folder dicts with id and name
+            folder_name_map: Mapping of folder id to folder name, used
+                instead of folders when given
 
         Returns:
             List of file dicts with folder_id and folder_name added
         """
         # Create a mapping from folder id to folder name for quick lookup
-        folder_name_map = {folder["id"]: folder["name"] for folder in folders}
+        if folder_name_map is None:
+            folder_name_map = {
+                folder["id"]: folder["name"] for folder in folders or []
+            }
 
         processed_files = []
-
         for file in files:
-            # Create a copy of the file dict to avoid modifying the original
-            file_copy = file.copy()
-
             # Get the first parent ID (assuming each file only has one parent)
-            parent_id = file["parents"][0] if file.get("parents") else None
-
-            # Add folder_id (renamed from parents)
-            file_copy["folder_id"] = parent_id
-
-            # Add folder_name if we have it in our mapping
-            file_copy["folder_name"] = folder_name_map.get(
+            parents = file.get("parents")
+            parent_id = parents[0] if parents else None
+
+            # Build the new dict in one go, without the parents key
+            processed_file = {
+                key: value for key, value in file.items() if key != "parents"
+            }
+            processed_file["folder_id"] = parent_id
+            processed_file["folder_name"] = folder_name_map.get(
                 parent_id, "Unknown Folder"
             )
-
-            # Remove the original parents key
-            if "parents" in file_copy:
-                del file_copy["parents"]
-
-            processed_files.append(file_copy)
+            processed_files.append(processed_file)
 
         return processed_files
 
     def get_sorted_versions_of_a_file(self, file_dict):
         """Retrieve versions of a file from Google Drive."""
-        file_id = file_dict["id"]
-        versions = gds_get_versions_of_a_file(
+        # cache_data hands out a fresh copy, so renaming below is safe
+        versions_sorted = _cached_sorted_versions(
             self.drive_service,
-            file_id,
-            fields="id, originalFilename, modifiedTime",
-        )
-
-        versions_sorted = sorted(
-            versions,
-            key=lambda x: x["modifiedTime"],
-            reverse=True,
+            self.user_email,
+            _listing_generation(self.user_email),
+            file_dict["id"],
+            file_dict.get("modifiedTime"),
         )
 
         for version in versions_sorted:
@@ -199,22 +371,14 @@ class CommentsHandler:
 
     def get_files_from_folder(self, search_term):
         """Get files from a folder in Google Drive that match a search term."""
-        drive_id = st.session_state.selected_drive["id"]
-        project_folder_id = st.session_state.selected_project_folder["id"]
-
-        files = gds_get_files(
-            service=self.drive_service,
-            drive_id=drive_id,
-            fields=("id, name"),
-            search_term=search_term,
-            folder_id=project_folder_id,
-        )
+        # Same listing as the file search, so both share one cached fetch
+        files = self.get_files_in_project_with_search_term(search_term)
 
         files_formatted = [
             {"id": file["id"], "name": file["name"]} for file in files
         ]
 
-        files_sorted = sorted(files_formatted, key=lambda x: x["name"])
+        files_sorted = sorted(files_formatted, key=itemgetter("name"))
         return files_sorted
 
     def get_comments_of_version(self, file, version):
@@ -225,14 +389,6 @@ class CommentsHandler:
 
         return comments
 
-    def sort_comments_by_timestamp(self, comments):
-        """Sort comments by timestamp."""
-        sorted_comments = sorted(
-            comments, key=lambda x: x["timestamp"], reverse=True
-        )
-
-        return sorted_comments
-
     def update_resolve_comment(self, file, version, comment_id, resolved):
         """Update the resolved status of a comment."""
         file_id = file["id"]
@@ -245,7 +401,7 @@ class CommentsHandler:
         """Save a reply to a comment."""
         file_id = file["id"]
         version_id = version["id"]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = time.strftime(TIMESTAMP_FORMAT)
 
         reply = mongo_save_reply(
             file_id,
@@ -266,19 +422,32 @@ class CommentsHandler:
 
     def get_version_media_content(self, file_id, version_id):
         """Get the content of a specific version of a file."""
-        content = gds_download_version_image(
-            self.drive_service, file_id, version_id
+        content, _ = _cached_content(
+            ("media", self.user_email, file_id, version_id),
+            lambda: self._download_version_media(file_id, version_id),
         )
-
         return content
 
     def get_version_content(self, file_id, version_id):
         """Get the content of a specific version of a file as bytes with mime type."""
         try:
-            file_bytes, mime_type = gds_get_file_revision_as_bytes(
-                self.drive_service, file_id, version_id
+            file_bytes, mime_type = _cached_content(
+                ("bytes", self.user_email, file_id, version_id),
+                lambda: self._download_version_bytes(file_id, version_id),
             )
             return file_bytes, mime_type
         except Exception as e:
             st.error(f"Error getting version content: {str(e)}")
             return None, None
+
+    def _download_version_bytes(self, file_id, version_id):
+        buffer, mime_type = gds_get_file_revision_as_bytes(
+            self.drive_service, file_id, version_id
+        )
+        return buffer.getvalue(), mime_type
+
+    def _download_version_media(self, file_id, version_id):
+        content = gds_download_version_image(
+            self.drive_service, file_id, version_id
+        )
+        return content, None
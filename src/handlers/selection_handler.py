@@ -5,15 +5,43 @@ from models.google_drive_utils import (
     gds_get_all_drives,
     gds_get_subfolders_hierarchical,
 )
+from operator import itemgetter
+import logging
 import streamlit as st
 
+logger = logging.getLogger(__name__)
+
+# Drives and folders change on a scale of minutes, not reruns (seconds)
+TOPOLOGY_CACHE_TTL = 120
+
+
+# The drive service is passed with a leading underscore so Streamlit doesn't
+# try to hash it; user_email keeps the cached results separate per user.
+@st.cache_data(ttl=TOPOLOGY_CACHE_TTL, max_entries=64, show_spinner=False)
+def _cached_drives(_drive_service, user_email):
+    drives = gds_get_all_drives(_drive_service)
+    return sorted(
+        ({"id": drive["id"], "name": drive["name"]} for drive in drives),
+        key=itemgetter("name"),
+    )
+
+
+@st.cache_data(ttl=TOPOLOGY_CACHE_TTL, max_entries=64, show_spinner=False)
+def _cached_folders_matching_search(
+    _drive_service, user_email, drive_id, search_term
+):
+    return gds_get_subfolders_hierarchical(
+        _drive_service, drive_id, search_term=search_term
+    )
+
 
 class SelectionHandler:
-    def __init__(self, drive_service, user_name):
+    def __init__(self, drive_service, user_name, user_email):
         """Initialize the selection handler with
-        the drive service and selected drive ID."""
+        the drive service and user info."""
         self.drive_service = drive_service
         self.user_name = user_name
+        self.user_email = user_email
 
     def get_all_drives_for_display(self):
         """
@@ -23,18 +51,7 @@ class SelectionHandler:
         Returns:
             list: A sorted list of dictionaries with "id" and "name" keys.
         """
-
-        drives = gds_get_all_drives(self.drive_service)
-
-        # Convert drives to list of dictionaries
-        drives_dict = [
-            {"id": drive["id"], "name": drive["name"]} for drive in drives
-        ]
-
-        # Sort drives by name
-        drives_sorted = sorted(drives_dict, key=lambda x: x["name"])
-
-        return drives_sorted
+        return _cached_drives(self.drive_service, self.user_email)
 
     def get_folders_matching_search(self, drive_id, search_term):
         """
@@ -53,9 +70,9 @@ class SelectionHandler:
             return None
 
         try:
-            print("Searching for project folders in drive...")
-            folders = gds_get_subfolders_hierarchical(
-                self.drive_service, drive_id, search_term=search_term
+            logger.debug("Searching for project folders in drive %s", drive_id)
+            folders = _cached_folders_matching_search(
+                self.drive_service, self.user_email, drive_id, search_term
             )
             return folders
         except Exception as e:
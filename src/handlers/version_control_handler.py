@@ -15,7 +15,9 @@ from models.google_drive_utils import (
     gds_get_file_revision_as_bytes,
     gds_delete_old_versions,
     gds_rename_file,
+    gds_rename_files,
     gds_update_keep_forever_version,
+    gds_update_keep_forever_versions,
     gds_get_most_recent_files_recursive,
     gds_create_folder,
 )
@@ -25,16 +27,74 @@ from models.general_utils import (
     format_mime_type,
 )
 from models.mongodb_model import (
-    mongo_get_version,
+    mongo_get_version_descriptions,
     mongo_save_version,
     mongo_delete_version,
 )
+from cachetools import TTLCache
+from handlers.auth_handler import refresh_if_expired
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+import io
+import logging
+import shutil
+import threading
 import zipfile
 from io import BytesIO
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of revisions downloaded at the same time
+MAX_DOWNLOAD_WORKERS = 8
+
+# Keys of a file formatted for display, with the function formatting them
+FILE_FORMATTERS = (
+    ("size", format_size),
+    ("createdTime", format_date),
+    ("modifiedTime", format_date),
+    ("mimeType", format_mime_type),
+)
+
+# How many folder names are kept and for how long (seconds)
+FOLDER_NAMES_CACHE_SIZE = 1024
+FOLDER_NAMES_CACHE_TTL = 60
+
+# Size of the chunks copied into zip downloads
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+# Files that are stored as is in zip downloads, they barely compress further
+COMPRESSED_EXTENSIONS = (
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".mp3",
+    ".mp4",
+    ".mov",
+    ".zip",
+    ".7z",
+    ".gz",
+    ".pdf",
+)
+
+
+@st.cache_resource
+def get_cleanup_executor():
+    """
+    Worker threads shared by all sessions for Drive clean-ups
+    that the user doesn't have to wait for.
+    """
+    return ThreadPoolExecutor(
+        max_workers=2, thread_name_prefix="drive-cleanup"
+    )
 
 
 class VersionControlHandler:
-    def __init__(self, drive_service, user_name):
+    def __init__(self, drive_service, user_name, credentials):
         """
         Initialize the version control handler
         with the drive service and user info.
@@ -42,9 +102,19 @@ class VersionControlHandler:
         Args:
             drive_service (obj): The Google Drive service instance.
             user_name (str): The name of the user.
+            credentials (Credentials): The user's credentials, used for the
+            connections of background and parallel work.
         """
         self.drive_service = drive_service
         self.user_name = user_name
+        self.credentials = credentials
+        # Background clean-ups of this session by file id, reported on a
+        # later run by pop_finished_cleanups
+        self._cleanups = {}
+        # Folder names by id, folders are rarely renamed
+        self._folder_names = TTLCache(
+            maxsize=FOLDER_NAMES_CACHE_SIZE, ttl=FOLDER_NAMES_CACHE_TTL
+        )
 
     def create_zip_file(self, file_data_list):
         """
@@ -59,14 +129,37 @@ class VersionControlHandler:
         """
         zip_buffer = BytesIO()
         with zipfile.ZipFile(
-            zip_buffer, "w", zipfile.ZIP_DEFLATED
+            zip_buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=1
         ) as zip_file:
             for file_data in file_data_list:
                 file_name = file_data["file_name"]
                 file_bytes = file_data["file_bytes"]
-                if isinstance(file_bytes, BytesIO):
-                    file_bytes = file_bytes.getvalue()
-                zip_file.writestr(file_name, file_bytes)
+                # Deflating already compressed formats only costs CPU
+                compress_type = (
+                    zipfile.ZIP_STORED
+                    if file_name.lower().endswith(COMPRESSED_EXTENSIONS)
+                    else zipfile.ZIP_DEFLATED
+                )
+
+                if not isinstance(file_bytes, BytesIO):
+                    zip_file.writestr(
+                        file_name, file_bytes, compress_type=compress_type
+                    )
+                    continue
+
+                # Stream the buffer into the archive in chunks, so the
+                # compressed copy of a large file is never held at once.
+                # An entry opened by name takes the archive's compression
+                # and level, so only the compression is switched per file.
+                zip_file.compression = compress_type
+                file_size = file_bytes.seek(0, io.SEEK_END)
+                file_bytes.seek(0)
+                with zip_file.open(
+                    file_name,
+                    "w",
+                    force_zip64=file_size > zipfile.ZIP64_LIMIT,
+                ) as zip_entry:
+                    shutil.copyfileobj(file_bytes, zip_entry, ZIP_CHUNK_SIZE)
         zip_buffer.seek(0)
         return zip_buffer
 
@@ -146,7 +239,7 @@ class VersionControlHandler:
             curr_file_id = file["id"]
             curr_file_name = file["name"]
             curr_file_type = file["mimeType"]
-            gds_upload_version(
+            uploaded_version = gds_upload_version(
                 self.drive_service,
                 curr_file_id,
                 curr_file_name,
@@ -155,9 +248,15 @@ class VersionControlHandler:
                 keep_forever,
                 current_mime_type=curr_file_type,
             )
+            if uploaded_version is None:
+                success = False
+                message = "Failed to upload version to Google Drive."
+                return success, message
 
             if keep_only_latest_version:
-                gds_delete_old_versions(self.drive_service, curr_file_id)
+                # The new version is already the head revision, so the
+                # cleanup doesn't have to hold up the upload
+                self._delete_old_versions_in_background(curr_file_id)
 
         except Exception as e:
             success = False
@@ -170,6 +269,10 @@ class VersionControlHandler:
             curr_version = gds_get_current_version(
                 self.drive_service, curr_file_id
             )
+            if curr_version is None:
+                success = False
+                message = "Failed to find the new version on Google Drive."
+                return success, message
             curr_version_id = curr_version["id"]
             curr_version_name = curr_version["originalFilename"]
 
@@ -191,12 +294,61 @@ class VersionControlHandler:
 
         if keep_only_latest_version:
             message += (
-                " Only the latest version will be kept, and older versions "
-                "have been deleted."
+                " Only the latest version will be kept, older versions "
+                "are being deleted and may still be listed for a moment."
             )
 
         return success, message
 
+    def _delete_old_versions_in_background(self, file_id):
+        """
+        Deletes all but the latest version of a file on a background thread.
+
+        Args:
+            file_id (str): The ID of the file.
+        """
+        credentials = self.credentials
+
+        def delete_old_versions():
+            refresh_if_expired(credentials)
+            # The service's httplib2 connection can't be shared with the
+            # script thread, so the cleanup uses a service of its own
+            service = build(
+                "drive",
+                "v3",
+                http=AuthorizedHttp(credentials, http=httplib2.Http()),
+                static_discovery=True,
+            )
+            gds_delete_old_versions(service, file_id)
+
+        def log_failure(future):
+            if future.exception() is not None:
+                logger.warning(
+                    "Error deleting old versions of file %s: %s",
+                    file_id,
+                    future.exception(),
+                )
+
+        future = get_cleanup_executor().submit(delete_old_versions)
+        future.add_done_callback(log_failure)
+        self._cleanups[file_id] = future
+
+    def pop_finished_cleanups(self):
+        """
+        Returns the background clean-ups that finished since the last call.
+
+        Returns:
+            list: A (file id, exception or None) tuple per finished clean-up.
+        """
+        finished = [
+            (file_id, future.exception())
+            for file_id, future in self._cleanups.items()
+            if future.done()
+        ]
+        for file_id, _ in finished:
+            del self._cleanups[file_id]
+        return finished
+
     def get_files_from_trash(self, drive_id):
         """
         Retrieves files from the trash in Google Drive.
@@ -207,28 +359,16 @@ class VersionControlHandler:
         Returns:
             list: A list of files with formatted details.
         """
-        # get files starting from the specified folder
+        # get files starting from the specified folder, the restore dialog
+        # only shows the name and folder, sorted by modified time
         files = gds_get_trashed_files(
             service=self.drive_service,
             drive_id=drive_id,
-            fields="mimeType, trashed, parents, modifiedTime,"
-            " createdTime, size, webViewLink, "
-            "webContentLink, id, name, description",
+            fields="id, name, parents, modifiedTime",
         )
 
         return files
 
-    def add_folder_name_to_files(self, files, folder_info):
-        """
-        Adds the folder name to each file.
-
-        Args:
-            files (list): A list of files.
-            folder_info (dict): A dictionary mapping
-            folder IDs to folder names.
-        """
-        # Map folder IDs to their names
-
     def restore_file(self, file_id):
         """
         Restore a file from the trash on Google Drive.
@@ -298,6 +438,8 @@ class VersionControlHandler:
 
             # Get the current version of the file(the one you just uploaded)
             new_version = gds_get_current_version(self.drive_service, file_id)
+            if new_version is None:
+                return False, "Failed to find the new version on Google Drive."
             new_version_id = new_version["id"]
             new_Version_name = new_version["originalFilename"]
 
@@ -366,53 +508,73 @@ class VersionControlHandler:
         Returns:
             list: A list of dictionaries containing folder information.
         """
-        folder_info = gds_get_folders_info(
-            self.drive_service, folder_ids, fields=fields
-        )
+        folder_names = self.get_folder_name_map(folder_ids, fields=fields)
+        folder_info = [
+            {"id": folder_id, "name": name}
+            for folder_id, name in folder_names.items()
+        ]
 
         return folder_info
 
-    def format_files_for_display(self, files, folder_info):
+    def get_folder_name_map(self, folder_ids, fields="id, name"):
+        """
+        Retrieves the names of specified folders in Google Drive.
+
+        Args:
+            folder_ids (list): A list of folder IDs.
+            fields (str): The fields to retrieve for each folder.
+
+        Returns:
+            dict: A dictionary mapping folder IDs to folder names.
+        """
+        # Only look up the folders whose names aren't cached yet
+        missing_ids = [
+            folder_id
+            for folder_id in folder_ids
+            if folder_id not in self._folder_names
+        ]
+        if missing_ids:
+            for folder in gds_get_folders_info(
+                self.drive_service, missing_ids, fields=fields
+            ):
+                self._folder_names[folder["id"]] = folder["name"]
+
+        folder_names = {}
+        for folder_id in folder_ids:
+            name = self._folder_names.get(folder_id)
+            if name is not None:
+                folder_names[folder_id] = name
+
+        return folder_names
+
+    def format_files_for_display(self, files, folder_names):
         """
         Adds the folder name and folder ID to
         each file and formats some keys for display.
 
         Args:
             files (list): A list of files.
-            folder_info (dict): A dictionary mapping
+            folder_names (dict): A dictionary mapping
             folder IDs to folder names.
 
         Returns:
             list: A list of files with formatted details.
         """
-        # Map folder IDs to their names
-        folder_names = {folder["id"]: folder["name"] for folder in folder_info}
-
-        # Add the folder name and folder ID to each file
+        get_folder_name = folder_names.get
         for file in files:
-            if file.get("parents"):
-
-                file["folder_name"] = folder_names.get(
-                    file["parents"][0], "N/A"
-                )
-                file["folder_id"] = file["parents"][0]
-
-                # remove the parents key
-                file.pop("parents")
+            # Replace the parents key by the folder name and folder ID
+            parents = file.pop("parents", None)
+            if parents:
+                file["folder_name"] = get_folder_name(parents[0], "N/A")
+                file["folder_id"] = parents[0]
             else:
                 file["folder_name"] = "N/A"
                 file["folder_id"] = None
 
-        # Format the files for display
-        for file in files:
-            if "size" in file:
-                file["size"] = format_size(file["size"])
-            if "createdTime" in file:
-                file["createdTime"] = format_date(file["createdTime"])
-            if "modifiedTime" in file:
-                file["modifiedTime"] = format_date(file["modifiedTime"])
-            if "mimeType" in file:
-                file["mimeType"] = format_mime_type(file["mimeType"])
+            # Format the file for display
+            for key, formatter in FILE_FORMATTERS:
+                if key in file:
+                    file[key] = formatter(file[key])
 
         return files
 
@@ -436,38 +598,25 @@ class VersionControlHandler:
             ),
         )
 
-        # Format the versions for display
-        for version in versions:
-            if "size" in version:
-                version["size"] = format_size(version["size"])
-            if "modifiedTime" in version:
-                version["modifiedTime"] = format_date(version["modifiedTime"])
-            if "mimeType" in version:
-                version["mimeType"] = format_mime_type(version["mimeType"])
+        # Sort versions by modified time so oldest is version 1. Drive's
+        # UTC ISO 8601 timestamps sort chronologically as plain strings,
+        # so this is done before they are formatted for display. Versions
+        # without a modified time are placed before the first version.
+        versions.sort(key=lambda version: version.get("modifiedTime", ""))
 
         # Add description to the versions
         # cause these are not saved on the drive
-        for version in versions:
-            version_on_mongo = mongo_get_version(file_id, version["id"])
-
-            # Add description key to version
-            version["description"] = "N/A"
-
-            # Check if version exists on MongoDB, if so update description
-            if version_on_mongo is not None:
-                if "description" in version_on_mongo:
-                    version["description"] = version_on_mongo["description"]
-
-        # Sort versions by created time so oldest is version 1
-        # If createdTime is "N/A", it will be placed even
-        # before the first version
-        versions.sort(
-            key=lambda x: (
-                x["modifiedTime"] != "N/A",
-                x["modifiedTime"] if x["modifiedTime"] != "N/A" else "",
-            )
+        descriptions = mongo_get_version_descriptions(
+            file_id, [version["id"] for version in versions]
         )
+
         for i, version in enumerate(versions, start=1):
+            # Format the version for display
+            for key, formatter in FILE_FORMATTERS:
+                if key in version:
+                    version[key] = formatter(version[key])
+
+            version["description"] = descriptions.get(version["id"], "N/A")
             version["versionNumber"] = i
 
         return versions
@@ -525,6 +674,10 @@ class VersionControlHandler:
                 description,
                 fields="id, name",
             )
+            if uploaded_file is None:
+                success = False
+                message = "Failed to upload file to Google Drive."
+                return success, message
             uploaded_file_id = uploaded_file["id"]
 
         except Exception as e:
@@ -543,6 +696,10 @@ class VersionControlHandler:
                 uploaded_file_id,
                 fields="id, originalFilename",
             )
+            if not revisions_of_file:
+                success = False
+                message = "Failed to find the uploaded file's version."
+                return success, message
             curr_version_id = revisions_of_file[0]["id"]
             curr_version_name = revisions_of_file[0]["originalFilename"]
 
@@ -637,6 +794,52 @@ class VersionControlHandler:
             print(f"Error getting revision as bytes: {str(e)}")
             return None, None
 
+    def get_revisions_as_bytes(self, file_id, version_ids):
+        """
+        Retrieves several file revisions concurrently from Google Drive.
+
+        Args:
+            file_id (str): The ID of the file.
+            version_ids (list): The IDs of the versions.
+
+        Returns:
+            list: A (file bytes, mime type) tuple per version id, in the
+            same order. Failed downloads give (None, None).
+        """
+        if not version_ids:
+            return []
+
+        # The workers share these credentials, refresh them once up front
+        # instead of letting several workers refresh the token at once
+        credentials = self.credentials
+        try:
+            refresh_if_expired(credentials)
+        except Exception as e:
+            logger.warning("Error refreshing credentials: %s", e)
+            return [(None, None)] * len(version_ids)
+        worker_state = threading.local()
+
+        def fetch(version_id):
+            # Each worker thread gets its own connection, the service's
+            # shared httplib2 connection can't be used from several threads.
+            # httplib2 keeps it alive, so later downloads of the same worker
+            # skip the TCP and TLS handshakes.
+            http = getattr(worker_state, "http", None)
+            if http is None:
+                http = AuthorizedHttp(credentials, http=httplib2.Http())
+                worker_state.http = http
+            try:
+                return gds_get_file_revision_as_bytes(
+                    self.drive_service, file_id, version_id, http=http
+                )
+            except Exception as e:
+                logger.warning("Error getting revision as bytes: %s", e)
+                return None, None
+
+        workers = min(MAX_DOWNLOAD_WORKERS, len(version_ids))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fetch, version_ids))
+
     def rename_file(self, file_id, new_name):
         """
         Renames a file on Google Drive.
@@ -651,6 +854,8 @@ class VersionControlHandler:
         """
         try:
             gds_rename_file(self.drive_service, file_id, new_name)
+            # The file may be a folder whose name is cached
+            self._folder_names.pop(file_id, None)
             success = True
             message = "File renamed successfully."
         except Exception as e:
@@ -659,6 +864,38 @@ class VersionControlHandler:
 
         return success, message
 
+    def rename_files(self, new_names):
+        """
+        Renames several files on Google Drive in batch requests.
+
+        Args:
+            new_names (dict): Maps file IDs to their new names.
+
+        Returns:
+            dict: Maps each file ID to a tuple containing a boolean
+            indicating success and a message.
+        """
+        try:
+            errors = gds_rename_files(self.drive_service, new_names)
+        except Exception as e:
+            return {
+                file_id: (False, f"Failed to rename file: {str(e)}")
+                for file_id in new_names
+            }
+
+        # Some of the files may be folders whose names are cached
+        for file_id in new_names:
+            self._folder_names.pop(file_id, None)
+
+        return {
+            file_id: (
+                (True, "File renamed successfully.")
+                if error is None
+                else (False, f"Failed to rename file: {str(error)}")
+            )
+            for file_id, error in errors.items()
+        }
+
     def update_version_keep_forever(self, file_id, version_id, keep_forever):
         """
         Updates the keep forever status of a version of a file on Google Drive.
@@ -683,3 +920,42 @@ class VersionControlHandler:
             success = False
             message = f"Failed to update keep forever status: {str(e)}"
             return success, message
+
+    def update_versions_keep_forever(self, file_id, version_ids, keep_forever):
+        """
+        Updates the keep forever status of several versions of a file
+        on Google Drive in batch requests.
+
+        Args:
+            file_id (str): The ID of the file.
+            version_ids (list): The IDs of the versions.
+            keep_forever (bool): Whether to keep the versions forever.
+
+        Returns:
+            dict: Maps each version ID to a tuple containing a
+            boolean indicating success and a message.
+        """
+        try:
+            errors = gds_update_keep_forever_versions(
+                self.drive_service, file_id, version_ids, keep_forever
+            )
+        except Exception as e:
+            return {
+                version_id: (
+                    False,
+                    f"Failed to update keep forever status: {str(e)}",
+                )
+                for version_id in version_ids
+            }
+
+        return {
+            version_id: (
+                (True, "Keep forever status updated successfully.")
+                if error is None
+                else (
+                    False,
+                    f"Failed to update keep forever status: {str(error)}",
+                )
+            )
+            for version_id, error in errors.items()
+        }
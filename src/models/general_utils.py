@@ -1,6 +1,9 @@
 from datetime import datetime
 from dateutil import tz
 
+# The server's local time zone, used when formatting dates
+LOCAL_TZ = tz.tzlocal()
+
 
 def format_folder_options(option):
     """
@@ -44,57 +47,59 @@ def format_file_options(option):
     return file_name
 
 
+# Readable names of the MIME types shown in the tables
+MIME_TYPE_NAMES = {
+    # Text & Documents
+    "text/plain": "Text File",
+    "application/pdf": "PDF Document",
+    "application/vnd.google-apps.document": "Google Docs",
+    "application/vnd.google-apps.spreadsheet": "Google Sheets",
+    # 3D Models
+    "model/fbx": "Autodesk FBX Model",
+    "model/obj": "Wavefront OBJ Model",
+    "model/gltf+json": "GLTF Model",
+    "model/gltf-binary": "GLB Model",
+    "application/x-blender": "Blender Project",
+    "application/x-3dsmax": "3ds Max File",
+    "application/x-maya": "Maya File",
+    "model/stl": "STL 3D Model",
+    "model/ply": "PLY 3D Model",
+    # Textures & Images
+    "image/png": "PNG Image",
+    "image/jpeg": "JPEG Image",
+    "image/x-targa": "TGA Texture",
+    "image/vnd-ms.dds": "DDS Texture",
+    "image/x-exr": "EXR Texture",
+    "image/bmp": "BMP Image",
+    "image/vnd.adobe.photoshop": "Photoshop PSD",
+    "image/vnd.radiance": "HDR Image",
+    # Audio
+    "audio/wav": "WAV Audio",
+    "audio/mpeg": "MP3 Audio",
+    "audio/ogg": "OGG Audio",
+    "audio/flac": "FLAC Audio",
+    # Video
+    "video/mp4": "MP4 Video",
+    "video/quicktime": "MOV Video",
+    "video/x-msvideo": "AVI Video",
+    "video/webm": "WebM Video",
+    # Scripts & Code
+    "text/x-python": "Python Script",
+    "text/x-csharp": "C# Script",
+    "text/x-c++src": "C++ Source File",
+    "text/x-c++hdr": "C++ Header File",
+    "text/x-lua": "Lua Script",
+    "application/json": "JSON File",
+    "application/xml": "XML File",
+    # Game Engine Files
+    "application/vnd.unity": "Unity Scene",
+    "application/vnd.unreal": "Unreal Asset",
+    "application/vnd.unreal-project": "Unreal Project",
+}
+
+
 def format_mime_type(mime_type):
-    mime_type_mapping = {
-        # Text & Documents
-        "text/plain": "Text File",
-        "application/pdf": "PDF Document",
-        "application/vnd.google-apps.document": "Google Docs",
-        "application/vnd.google-apps.spreadsheet": "Google Sheets",
-        # 3D Models
-        "model/fbx": "Autodesk FBX Model",
-        "model/obj": "Wavefront OBJ Model",
-        "model/gltf+json": "GLTF Model",
-        "model/gltf-binary": "GLB Model",
-        "application/x-blender": "Blender Project",
-        "application/x-3dsmax": "3ds Max File",
-        "application/x-maya": "Maya File",
-        "model/stl": "STL 3D Model",
-        "model/ply": "PLY 3D Model",
-        # Textures & Images
-        "image/png": "PNG Image",
-        "image/jpeg": "JPEG Image",
-        "image/x-targa": "TGA Texture",
-        "image/vnd-ms.dds": "DDS Texture",
-        "image/x-exr": "EXR Texture",
-        "image/bmp": "BMP Image",
-        "image/vnd.adobe.photoshop": "Photoshop PSD",
-        "image/vnd.radiance": "HDR Image",
-        # Audio
-        "audio/wav": "WAV Audio",
-        "audio/mpeg": "MP3 Audio",
-        "audio/ogg": "OGG Audio",
-        "audio/flac": "FLAC Audio",
-        # Video
-        "video/mp4": "MP4 Video",
-        "video/quicktime": "MOV Video",
-        "video/x-msvideo": "AVI Video",
-        "video/webm": "WebM Video",
-        # Scripts & Code
-        "text/x-python": "Python Script",
-        "text/x-csharp": "C# Script",
-        "text/x-c++src": "C++ Source File",
-        "text/x-c++hdr": "C++ Header File",
-        "text/x-lua": "Lua Script",
-        "application/json": "JSON File",
-        "application/xml": "XML File",
-        # Game Engine Files
-        "application/vnd.unity": "Unity Scene",
-        "application/vnd.unreal": "Unreal Asset",
-        "application/vnd.unreal-project": "Unreal Project",
-    }
-
-    return mime_type_mapping.get(mime_type, "Unknown File Type")
+    return MIME_TYPE_NAMES.get(mime_type, "Unknown File Type")
 
 
 def format_size(size_in_bytes):
@@ -155,7 +160,7 @@ def format_date(date_input):
             # Parse the date as UTC
             dt = datetime.fromisoformat(date_input.replace("Z", "+00:00"))
             # Convert to local time zone
-            dt = dt.replace(tzinfo=tz.UTC).astimezone(tz.tzlocal())
+            dt = dt.replace(tzinfo=tz.UTC).astimezone(LOCAL_TZ)
             return dt.strftime("%Y-%m-%d %H:%M:%S")
 
         # If the input is neither a string nor a datetime object, return "N/A"
@@ -11,6 +11,22 @@ import streamlit as st
 
 import mimetypes
 
+# Number of calls sent per batch request. Google accepts up to 100, but
+# Drive tends to answer large batches with rate limit and 500 errors.
+BATCH_REQUEST_LIMIT = 25
+
+# Streams larger than this are uploaded in resumable chunks of the given size
+# instead of one multipart request, which builds the whole body in memory
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Number of folders combined in one "in parents" query, keeps queries short
+PARENTS_PER_QUERY = 50
+
+# Most folders collected when walking a folder tree, bounds the number of
+# queries made for very large trees
+MAX_TREE_FOLDERS = 2000
+
 
 def download_file_version(service, file_id, version_id):
     """Download a specific version of a file."""
@@ -70,7 +86,9 @@ def gds_get_trashed_files(service, drive_id, fields="id, name"):
         return []
 
 
-def gds_get_file_revision_as_bytes(drive_service, file_id, revision_id):
+def gds_get_file_revision_as_bytes(
+    drive_service, file_id, revision_id, http=None
+):
     """
     Downloads a specific revision from Google Drive and returns it as a BytesIO buffer.
 
@@ -78,6 +96,9 @@ def gds_get_file_revision_as_bytes(drive_service, file_id, revision_id):
         drive_service: Authenticated Google Drive service instance.
         file_id (str): ID of the file.
         revision_id (str): ID of the revision.
+        http: Optional authorized Http to send the requests with instead of
+            the service's own. Needed when downloading from several threads,
+            httplib2 connections are not thread-safe.
 
     Returns:
         A BytesIO object containing the file data, and the MIME type if available.
@@ -85,6 +106,8 @@ def gds_get_file_revision_as_bytes(drive_service, file_id, revision_id):
     request = drive_service.revisions().get_media(
         fileId=file_id, revisionId=revision_id
     )
+    if http is not None:
+        request.http = http
     buffer = io.BytesIO()
     downloader = MediaIoBaseDownload(buffer, request)
 
@@ -97,8 +120,8 @@ def gds_get_file_revision_as_bytes(drive_service, file_id, revision_id):
     # Optionally, get MIME type for download_button
     revision_metadata = (
         drive_service.revisions()
-        .get(fileId=file_id, revisionId=revision_id)
-        .execute()
+        .get(fileId=file_id, revisionId=revision_id, fields="mimeType")
+        .execute(http=http)
     )
     mime_type = revision_metadata.get("mimeType", "application/octet-stream")
 
@@ -158,7 +181,10 @@ def gds_delete_file(drive_service, file_id, delete_permanently=False):
         else:
             print("Moving file to trash...")
             drive_service.files().update(
-                fileId=file_id, body={"trashed": True}, supportsAllDrives=True
+                fileId=file_id,
+                body={"trashed": True},
+                supportsAllDrives=True,
+                fields="id",
             ).execute()
 
         return True
@@ -546,7 +572,7 @@ def gds_upload_file(
         if hasattr(file_path, "name"):
             file_name = file_path.name
             mime_type = file_path.type
-            media = MediaIoBaseUpload(file_path, mimetype=mime_type)
+            media = _media_io_upload(file_path, mime_type)
 
         else:
             file_name = file_path.split("/")[-1]
@@ -584,6 +610,23 @@ def gds_upload_file(
         return None
 
 
+def _media_io_upload(stream, mime_type):
+    """
+    Wraps an in-memory stream for uploading. Small streams go in a single
+    multipart request, large ones as a resumable upload in big chunks.
+    """
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(0)
+    if size <= RESUMABLE_UPLOAD_THRESHOLD:
+        return MediaIoBaseUpload(stream, mimetype=mime_type)
+    return MediaIoBaseUpload(
+        stream,
+        mimetype=mime_type,
+        chunksize=UPLOAD_CHUNK_SIZE,
+        resumable=True,
+    )
+
+
 def gds_get_files(
     service,
     drive_id,
@@ -718,24 +761,88 @@ def gds_get_folders_info(service, folder_ids, fields="id, name"):
         List of dicts with 'id' and 'name' of each folder.
     """
     print("Fetching folder information...")
+    # Send the lookups as batch requests instead of one round-trip per id
+    results = _execute_batch(
+        service,
+        {
+            folder_id: service.files().get(
+                fileId=folder_id,
+                fields=fields,
+                supportsAllDrives=True,
+            )
+            for folder_id in folder_ids
+        },
+    )
+
     folders = []
+    for folder_id, (folder, error) in results.items():
+        if error is not None:
+            print(f"Error fetching folder {folder_id}: {error}")
+            continue
+        folders.append({"id": folder["id"], "name": folder["name"]})
 
-    for folder_id in folder_ids:
-        try:
-            folder = (
-                service.files()
-                .get(
-                    fileId=folder_id,
-                    fields=fields,
-                    supportsAllDrives=True,
-                )
-                .execute()
+    return folders
+
+
+def gds_rename_files(service, new_names):
+    """
+    Renames several files in Google Drive using batch requests.
+
+    Args:
+        service: Authorized Google Drive API service instance.
+        new_names: Dict mapping file IDs to their new names.
+
+    Returns:
+        Dict mapping each file ID to the error of its rename, None if it succeeded.
+    """
+    print("Renaming files...")
+    results = _execute_batch(
+        service,
+        {
+            file_id: service.files().update(
+                fileId=file_id,
+                body={"name": new_name},
+                fields="id",
+                supportsAllDrives=True,
             )
-            folders.append({"id": folder["id"], "name": folder["name"]})
+            for file_id, new_name in new_names.items()
+        },
+    )
+    return {file_id: error for file_id, (_, error) in results.items()}
+
+
+def _execute_batch(service, requests):
+    """
+    Sends Drive API requests as batch requests of at most
+    BATCH_REQUEST_LIMIT calls each, instead of one round-trip per request.
+
+    Args:
+        service: Authorized Google Drive API service instance.
+        requests: Dict mapping a unique id to an unexecuted request.
+
+    Returns:
+        Dict mapping each id to a (response, exception) tuple, in the order
+        of the requests. Exactly one of the two is None.
+    """
+    results = {}
+
+    def handle_response(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    request_ids = list(requests)
+    for start in range(0, len(request_ids), BATCH_REQUEST_LIMIT):
+        chunk = request_ids[start : start + BATCH_REQUEST_LIMIT]
+        batch = service.new_batch_http_request(callback=handle_response)
+        for request_id in chunk:
+            batch.add(requests[request_id], request_id=request_id)
+        try:
+            batch.execute()
         except Exception as e:
-            print(f"Error fetching folder {folder_id}: {e}")
+            # The whole batch failed, report it for each request in it
+            for request_id in chunk:
+                results.setdefault(request_id, (None, e))
 
-    return folders
+    return {request_id: results[request_id] for request_id in request_ids}
 
 
 def gds_move_file(drive_service, file_id, current_parent_id, new_parent_id):
@@ -824,7 +931,9 @@ class DriveModel:
         """Check if a specific drive exists and is accessible."""
         try:
             # Attempt to fetch the drive details
-            self.drive_service.drives().get(driveId=drive_id).execute()
+            self.drive_service.drives().get(
+                driveId=drive_id, fields="id"
+            ).execute()
             return True
         except Exception as e:
             st.error(f"An error occurred: {e}")
@@ -880,6 +989,12 @@ def gds_get_most_recent_files_recursive(
     Lists the most recently modified files in the user's Google Drive, searching recursively in subfolders.
     Excluding the google workspace files.
 
+    Without a folder the whole drive is queried directly in a single
+    sorted query; for My Drive that covers the files the user owns.
+    Within a folder, the folder tree is walked one level at a time, with
+    all folders of a level listed together, and the files of all folders
+    are then queried at once, sorted by Drive.
+
     :param service: Authenticated Google Drive API service instance.
     :param drive_id: ID of the drive to search (use None for My Drive).
     :param fields: Fields to return for each file.
@@ -888,76 +1003,60 @@ def gds_get_most_recent_files_recursive(
     :return: List of the most recent files with their IDs and names.
     """
     print("Fetching most recent files...")
+    list_options = {
+        "corpora": "drive" if drive_id else "user",
+        "driveId": drive_id if drive_id else None,
+        "includeItemsFromAllDrives": bool(drive_id),
+        "supportsAllDrives": bool(drive_id),
+    }
+    # Files only, excluding trashed files and google workspace files
+    files_query = (
+        "mimeType != 'application/vnd.google-apps.folder' and "
+        "trashed = false and "
+        "mimeType != 'application/vnd.google-apps.shortcut' and "
+        "mimeType != 'application/vnd.google-apps.document' and "
+        "mimeType != 'application/vnd.google-apps.spreadsheet' and "
+        "mimeType != 'application/vnd.google-apps.presentation'"
+    )
     try:
-        # List to store all files
-        all_files = []
-
-        # Function to recursively search for files
-        def search_folder(folder_id):
-            nonlocal all_files
-            if len(all_files) >= max_results:
-                return
-
-            # Query to find files in the current folder
-            # (excluding subfolders. trashed files and
-            # google workspace files
+        if not folder_id:
+            # The whole drive, a single sorted query does it. Without the
+            # owner filter My Drive would include files shared with the user
             query = (
-                f"'{folder_id}' in parents and "
-                "mimeType != 'application/vnd.google-apps.folder' and "
-                "trashed = false and "
-                "mimeType != 'application/vnd.google-apps.shortcut' and "
-                "mimeType != 'application/vnd.google-apps.document' and "
-                "mimeType != 'application/vnd.google-apps.spreadsheet' and "
-                "mimeType != 'application/vnd.google-apps.presentation'"
+                files_query
+                if drive_id
+                else f"'me' in owners and {files_query}"
             )
-            file_results = (
+            return (
                 service.files()
                 .list(
                     q=query,
-                    corpora="drive" if drive_id else "user",
-                    driveId=drive_id if drive_id else None,
-                    includeItemsFromAllDrives=bool(drive_id),
-                    supportsAllDrives=bool(drive_id),
-                    pageSize=max_results - len(all_files),
+                    pageSize=max_results,
                     fields=f"files({fields})",
                     orderBy="modifiedTime desc",
+                    **list_options,
                 )
                 .execute()
+                .get("files", [])
             )
-            files = file_results.get("files", [])
-            all_files.extend(files)
-
-            # If we haven't reached max_results, search subfolders
-            if len(all_files) < max_results:
-                # Query to find subfolders in the current folder
-                folder_query = (
-                    f"'{folder_id}' in parents and "
-                    "mimeType = 'application/vnd.google-apps.folder' and "
-                    "trashed = false"
-                )
-                folder_results = (
-                    service.files()
-                    .list(
-                        q=folder_query,
-                        corpora="drive" if drive_id else "user",
-                        driveId=drive_id if drive_id else None,
-                        includeItemsFromAllDrives=bool(drive_id),
-                        supportsAllDrives=bool(drive_id),
-                        pageSize=100,  # Adjust as needed
-                        fields="files(id)",
-                    )
-                    .execute()
-                )
-                subfolders = folder_results.get("files", [])
-                for subfolder in subfolders:
-                    search_folder(subfolder["id"])
 
-        # Start the recursive search
-        if folder_id:
-            search_folder(folder_id)
-        else:
-            # If no folder_id is provided, start from the root of the drive
-            search_folder("root")
+        folder_ids = _get_folder_tree_ids(service, folder_id, list_options)
+
+        all_files = []
+        for start in range(0, len(folder_ids), PARENTS_PER_QUERY):
+            chunk = folder_ids[start : start + PARENTS_PER_QUERY]
+            response = (
+                service.files()
+                .list(
+                    q=f"{_in_parents_query(chunk)} and {files_query}",
+                    pageSize=max_results,
+                    fields=f"files({fields})",
+                    orderBy="modifiedTime desc",
+                    **list_options,
+                )
+                .execute()
+            )
+            all_files.extend(response.get("files", []))
 
         # Sort all files by modifiedTime (descending) and return up to max_results
         all_files.sort(key=lambda x: x.get("modifiedTime", ""), reverse=True)
@@ -969,6 +1068,64 @@ def gds_get_most_recent_files_recursive(
         return []
 
 
+def _in_parents_query(folder_ids):
+    """Builds a query matching items directly inside any of the folders."""
+    clauses = " or ".join(
+        f"'{folder_id}' in parents" for folder_id in folder_ids
+    )
+    return f"({clauses})"
+
+
+def _get_folder_tree_ids(service, folder_id, list_options):
+    """
+    Collects the IDs of a folder and all of its subfolders, listing the
+    subfolders of a whole level of the tree per query.
+
+    Args:
+        service: Authenticated Google Drive API service instance.
+        folder_id: ID of the folder at the top of the tree.
+        list_options: Drive and corpora arguments for files().list.
+
+    Returns:
+        List of folder IDs, starting with folder_id. Trees larger than
+        MAX_TREE_FOLDERS are cut off at that many folders.
+    """
+    folder_ids = [folder_id]
+    level = [folder_id]
+    while level and len(folder_ids) < MAX_TREE_FOLDERS:
+        next_level = []
+        for start in range(0, len(level), PARENTS_PER_QUERY):
+            chunk = level[start : start + PARENTS_PER_QUERY]
+            query = (
+                f"{_in_parents_query(chunk)} and "
+                "mimeType = 'application/vnd.google-apps.folder' and "
+                "trashed = false"
+            )
+            page_token = None
+            while True:
+                response = (
+                    service.files()
+                    .list(
+                        q=query,
+                        pageSize=1000,
+                        fields="nextPageToken, files(id)",
+                        pageToken=page_token,
+                        **list_options,
+                    )
+                    .execute()
+                )
+                next_level.extend(
+                    folder["id"] for folder in response.get("files", [])
+                )
+                page_token = response.get("nextPageToken")
+                if page_token is None:
+                    break
+        folder_ids.extend(next_level)
+        level = next_level
+
+    return folder_ids[:MAX_TREE_FOLDERS]
+
+
 def gds_revert_version(
     service, file_id, file_name, revision_id, revision_name
 ):
@@ -1019,34 +1176,38 @@ def gds_revert_version(
         gds_rename_file(service, file_id, revision_name)
 
         # Upload the new version with correct MIME type
-        media = MediaIoBaseUpload(file_buffer, mimetype=mime_type)
+        media = _media_io_upload(file_buffer, mime_type)
 
         updated_file = (
             service.files()
             .update(
                 fileId=file_id,
                 media_body=media,
-                fields="id,name",
+                fields="id,name,headRevisionId",
                 supportsAllDrives=True,
             )
             .execute()
         )
 
         # Step 4: Get the latest revision ID (the one we just created)
-        revisions = (
-            service.revisions()
-            .list(fileId=file_id, fields="revisions(id)")
-            .execute()
-            .get("revisions", [])
-        )
+        new_revision_id = updated_file.get("headRevisionId")
+        if not new_revision_id:
+            revisions = (
+                service.revisions()
+                .list(fileId=file_id, fields="revisions(id)")
+                .execute()
+                .get("revisions", [])
+            )
+            if revisions:
+                new_revision_id = revisions[-1]["id"]
 
-        if revisions:
-            new_revision_id = revisions[-1]["id"]
+        if new_revision_id:
             # Set keepForever status to match the original version
             service.revisions().update(
                 fileId=file_id,
                 revisionId=new_revision_id,
                 body={"keepForever": keep_forever},
+                fields="id",
             ).execute()
 
         # Restore the original file name
@@ -1094,7 +1255,7 @@ def gds_upload_version(
         if hasattr(file_path, "name"):
             version_name = file_path.name
             new_mime_type = file_path.type
-            media = MediaIoBaseUpload(file_path, mimetype=new_mime_type)
+            media = _media_io_upload(file_path, new_mime_type)
 
         else:
             version_name = os.path.basename(file_path)
@@ -1120,7 +1281,7 @@ def gds_upload_version(
             fileId=file_id,
             body=file_metadata,
             media_body=media,
-            fields="id, name",
+            fields="id, name, headRevisionId",
             supportsAllDrives=True,
         )
 
@@ -1128,8 +1289,13 @@ def gds_upload_version(
 
         # Step 3: set the version to keep forever
         if keep_forever:
-            latest_version = gds_get_current_version(drive_service, file_id)
-            latest_version_id = latest_version["id"]
+            # The head revision is the version that was just uploaded
+            latest_version_id = uploaded_version.get("headRevisionId")
+            if not latest_version_id:
+                latest_version = gds_get_current_version(
+                    drive_service, file_id
+                )
+                latest_version_id = latest_version["id"]
             gds_update_keep_forever_version(
                 drive_service, file_id, latest_version_id, keep_forever=True
             )
@@ -1169,6 +1335,7 @@ def gds_update_keep_forever_version(
             fileId=file_id,
             revisionId=revision_id,
             body={"keepForever": keep_forever},
+            fields="id",
         ).execute()
 
         return True
@@ -1178,6 +1345,39 @@ def gds_update_keep_forever_version(
         return False
 
 
+def gds_update_keep_forever_versions(
+    drive_service, file_id, revision_ids, keep_forever=True
+):
+    """
+    Updates the 'keepForever' status of several versions of a file
+    using batch requests.
+
+    Args:
+        drive_service: Authenticated Google Drive API service instance.
+        file_id: ID of the file to update the versions for.
+        revision_ids: IDs of the revisions to update.
+        keep_forever: Boolean flag to set the versions to keep forever.
+
+    Returns:
+        Dict mapping each revision ID to the error of its update, None if it succeeded.
+    """
+    results = _execute_batch(
+        drive_service,
+        {
+            revision_id: drive_service.revisions().update(
+                fileId=file_id,
+                revisionId=revision_id,
+                body={"keepForever": keep_forever},
+                fields="id",
+            )
+            for revision_id in revision_ids
+        },
+    )
+    return {
+        revision_id: error for revision_id, (_, error) in results.items()
+    }
+
+
 def gds_delete_old_versions(drive_service, file_id):
     """ "
     Deletes all previous versions of a file in Google Drive."
@@ -1196,13 +1396,19 @@ def gds_delete_old_versions(drive_service, file_id):
         return
 
     current_revision_id = revisions[-1]["id"]
-    for revision in revisions:
-        revision_id = revision["id"]
-        if revision_id != current_revision_id:
-            try:
-                drive_service.revisions().delete(
-                    fileId=file_id, revisionId=revision_id
-                ).execute()
-                print(f"Deleted revision {revision_id}")
-            except Exception as e:
-                print(f"Error deleting revision {revision_id}: {e}")
+    # Delete the old revisions in batches instead of one call per revision
+    results = _execute_batch(
+        drive_service,
+        {
+            revision["id"]: drive_service.revisions().delete(
+                fileId=file_id, revisionId=revision["id"]
+            )
+            for revision in revisions
+            if revision["id"] != current_revision_id
+        },
+    )
+    for revision_id, (_, error) in results.items():
+        if error is None:
+            print(f"Deleted revision {revision_id}")
+        else:
+            print(f"Error deleting revision {revision_id}: {error}")
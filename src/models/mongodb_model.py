@@ -1,7 +1,10 @@
 from pymongo.mongo_client import MongoClient
 from bson import ObjectId
+import logging
 import streamlit as st
 
+logger = logging.getLogger(__name__)
+
 uri = st.secrets["mongodb"]["uri"]
 print("Connecting to MongoDB...")
 # Create a new client and connect to the server
@@ -105,6 +108,54 @@ def mongo_get_version(file_id, version_id):
     return None
 
 
+def mongo_get_version_descriptions(file_id, version_ids):
+    """
+    Retrieves the descriptions of several versions of a file from MongoDB
+    in one query. The versions are filtered on the server, so only their
+    IDs and descriptions are sent back.
+
+    Args:
+        file_id (str): The ID of the file.
+        version_ids (list): The IDs of the versions.
+
+    Returns:
+        dict: The descriptions of the versions found, keyed by version ID.
+    """
+    logger.debug("Retrieving version descriptions from MongoDB...")
+    pipeline = [
+        {"$match": {"file_id": file_id}},
+        {
+            "$project": {
+                "_id": 0,
+                "versions": {
+                    "$map": {
+                        "input": {
+                            "$filter": {
+                                "input": "$versions",
+                                "cond": {
+                                    "$in": ["$$this.id", list(version_ids)]
+                                },
+                            }
+                        },
+                        "in": {
+                            "id": "$$this.id",
+                            "description": "$$this.description",
+                        },
+                    }
+                },
+            }
+        },
+    ]
+
+    descriptions = {}
+    for result in revisions_collection.aggregate(pipeline):
+        for version in result.get("versions") or []:
+            if "description" in version:
+                descriptions[version["id"]] = version["description"]
+
+    return descriptions
+
+
 def mongo_get_file_description(file_id):
     """
     Retrieves the original description of a file.
@@ -143,16 +194,13 @@ def mongo_get_comments_of_version(file_id, version_id):
     print("Fetching comments from MongoDB...")
     # Create the query to find the document using the new field names
     query = {"id": file_id, "versions.id": version_id}
+    # Only return the matching version, not the comments of every version
+    projection = {"versions.$": 1}
 
-    # Find the document in the collection
-    existing_doc = comment_collection.find_one(query)
+    existing_doc = comment_collection.find_one(query, projection)
 
-    # If the document exists, retrieve the comments for the specific version
-    if existing_doc:
-        # Loop through the versions to find the one with the given version_id
-        for version in existing_doc["versions"]:
-            if version["id"] == version_id:
-                return version.get("comments", [])
+    if existing_doc and existing_doc.get("versions"):
+        return existing_doc["versions"][0].get("comments", [])
 
     # If no document or version found, return an empty list
     return []
@@ -1,5 +1,6 @@
 # auth_view.py
 import streamlit as st
+import streamlit.components.v1 as components
 
 
 class AuthView:
@@ -38,6 +39,37 @@ class AuthView:
     def show_warning(message):
         st.warning(message)
 
+    @staticmethod
+    def set_cookie(name, value, max_age):
+        """
+        Set a cookie on the app page from a hidden component.
+        Cookies set from JavaScript can't be HttpOnly, so scripts on the
+        page can read it; Secure at least keeps it off plain HTTP.
+        """
+        components.html(
+            f"""
+            <script>
+                window.parent.document.cookie =
+                    "{name}={value}; max-age={max_age}; path=/; "
+                    + "Secure; SameSite=Lax";
+            </script>
+            """,
+            height=0,
+        )
+
+    @staticmethod
+    def expire_cookie(name):
+        """Remove a cookie set by set_cookie from the browser."""
+        AuthView.set_cookie(name, "", 0)
+
+    @staticmethod
+    def show_logout_button():
+        """Show a log out button in the sidebar, returns True if clicked."""
+        with st.sidebar:
+            return st.button(
+                ":material/logout: Log out", key="logout", help="Log out"
+            )
+
     @staticmethod
     def configure_page(wide_layout=True, expanded_sidebar=True, title=None):
         st.set_page_config(
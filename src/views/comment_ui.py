@@ -1,3 +1,4 @@
+from html import escape
 import streamlit as st
 from models.general_utils import format_file_options
 
@@ -300,9 +301,9 @@ class CommentUI:
             st.markdown(
                 f"""
                 <div style='margin-left: 10px; font-size: 0.9em'>
-                    <strong>{reply['user']}</strong> <em>(on {reply['timestamp']})</em>
+                    <strong>{escape(reply['user'])}</strong> <em>(on {reply['timestamp']})</em>
                     <br>
-                    {reply['content']}
+                    {escape(reply['content'])}
                 </div>
                 """,
                 unsafe_allow_html=True,
@@ -340,12 +341,13 @@ class CommentUI:
     def _display_comment_content(self, column, comment):
         """Display the comment content with metadata."""
         with column:
+            # Comments are rendered as HTML, so what users wrote is escaped
             status = "Resolved" if comment.get("resolved", False) else "Open"
             status_color = "green" if status == "Resolved" else "red"
             st.markdown(
-                f"🗨️ **{comment['user']}** _(on {comment['timestamp']})_ "
+                f"🗨️ **{escape(comment['user'])}** _(on {comment['timestamp']})_ "
                 f"<span style='color: {status_color}; font-size: 0.9em'>• {status}</span>"
-                f"  \n{comment['content']}",
+                f"  \n{escape(comment['content'])}",
                 unsafe_allow_html=True,
             )
 
@@ -407,6 +409,42 @@ class CommentUI:
             return {"id": comment["id"], "action": action}
         return None
 
+    def display_comment_pagination(self, page, page_count):
+        """
+        Display previous/next buttons for paging through comments.
+
+        Args:
+            page (int): Index of the page currently shown.
+            page_count (int): Total number of pages.
+
+        Returns:
+            int: The page to switch to, or None if no button was clicked.
+        """
+        if page_count <= 1:
+            return None
+
+        col_prev, col_info, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button(
+                ":material/chevron_left:",
+                key="comments_prev_page",
+                disabled=page == 0,
+                help="Previous comments",
+            ):
+                return page - 1
+        with col_info:
+            st.caption(f"Page {page + 1} of {page_count}")
+        with col_next:
+            if st.button(
+                ":material/chevron_right:",
+                key="comments_next_page",
+                disabled=page >= page_count - 1,
+                help="More comments",
+            ):
+                return page + 1
+
+        return None
+
     def display_container(self, height=500, border=False):
         return st.container(height=height, border=border)
 